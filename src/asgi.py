@@ -0,0 +1,215 @@
+"""
+ASGI entry point for the node, an alternative to the Flask server in main.py.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+    python3 asgi.py
+
+Every change to the chain, balances or mempool goes through a single StateWriter, one
+mutation at a time on its own thread, so the event loop keeps serving while a block is
+being applied. Reads never wait for it: they run on a pool of reader threads, as some of
+them (eth_call, eth_getLogs, archived blocks) take a while, and never take the chain lock.
+
+What readers see is not entirely the published view. Blocks, balances and transaction
+counts come from it and are fixed at its height. Lookups in the block and transaction
+indexes go to the live dicts the writer adds to. Each is a single dict operation, which is
+atomic, and hits past the view's height are ignored. Receipts of contract calls,
+contracts and their events are also read live, under their own locks where they have one.
+They can be newer than the view, so a batch may see a receipt or a log for a call whose
+block number is past the view's height.
+"""
+import asyncio
+import json
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from blockchain import Blockchain
+from jobboard import poll_response, POLL_TIMEOUT
+from rpc import encode_response, handle_single, handle_reads, handle_writes, is_write, rpc_error, handle_add_balance, handle_submit_mined_block, handle_submit_job
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+    (b'access-control-allow-headers', b'Content-Type'),
+]
+
+
+class StateWriter:
+    """Runs state mutations one at a time, in the order they were submitted, on a dedicated thread."""
+
+    def __init__(self):
+        self.queue = None
+        self.task = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='state-writer')
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self.run_forever())
+
+    async def run_forever(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            fn, args, future = await self.queue.get()
+            try:
+                result = await loop.run_in_executor(self.executor, fn, *args)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+
+    async def submit(self, fn, *args):
+        """Queue `fn(*args)` behind every mutation submitted before it and wait for its result."""
+        if self.task is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((fn, args, future))
+        return await future
+
+    async def stop(self):
+        """Finish the queued mutations, then stop the writer."""
+        if self.task is not None:
+            while not self.queue.empty():
+                await asyncio.sleep(0.01)
+            self.task.cancel()
+            self.task = None
+        self.executor.shutdown(wait=True)
+
+
+class Node:
+    """The ASGI application: routes requests, reads from the published view, writes through the StateWriter."""
+
+    def __init__(self, blockchain=None):
+        self.blockchain = blockchain
+        self.writer = StateWriter()
+        self.readers = ThreadPoolExecutor(thread_name_prefix='reader')
+        self.job_changed = None  # asyncio.Event, set and replaced whenever a new mining job is published
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.blockchain is None:
+                    self.blockchain = Blockchain()
+                self.writer.start()
+                self.watch_jobs()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.writer.stop()
+                self.readers.shutdown(wait=True)
+                self.blockchain.save_all()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        method, path = scope['method'], scope['path']
+        if method == 'OPTIONS':
+            return await self.respond(send, 204, b'')
+        try:
+            if path == '/':
+                return await self.respond(send, 200, b"XYL TestNet is alive and working properly.", b'text/plain')
+            if path in ('/rpc/', '/rpc') and method == 'POST':
+                data = await self.read_json(receive)
+                return await self.respond(send, 200, encode_response(await self.rpc(data)), b'application/json')
+            if path == '/get_mining_job' and method == 'GET':
+                miner = parse_qs(scope.get('query_string', b'').decode()).get('miner', [None])[0]
+                body = self.blockchain.job_board.body_for(miner, self.blockchain.job_board.current()[2])
+                return await self.respond(send, 200, body, b'application/json')
+            if path == '/poll_mining_job' and method == 'GET':
+                return await self.respond(send, 200, await self.poll_mining_job(scope), b'application/json')
+            if path == '/submit_job' and method == 'POST':
+                data = await self.read_json(receive)
+                response, status = await self.writer.submit(handle_submit_job, self.blockchain, data)
+                return await self.respond_json(send, status, response)
+            if path == '/submit_mined_block' and method == 'POST':
+                data = await self.read_json(receive)
+                response, status = await self.writer.submit(handle_submit_mined_block, self.blockchain, data)
+                return await self.respond_json(send, status, response)
+            if path == '/admin/add_balance' and method == 'POST':
+                data = await self.read_json(receive)
+                client = (scope.get('client') or ('', 0))[0]
+                response, status = await self.writer.submit(handle_add_balance, self.blockchain, data, client)
+                return await self.respond_json(send, status, response)
+        except json.JSONDecodeError:
+            return await self.respond_json(send, 400, rpc_error({}, 'Parse error', -32700))
+        except Exception:
+            print(traceback.format_exc())
+            return await self.respond(send, 500, b'Internal Server Error', b'text/plain')
+        await self.respond(send, 404, b'Not Found', b'text/plain')
+
+    async def rpc(self, data):
+        """Answer a single request or a batch, reads from one view on a reader thread and writes through the writer."""
+        loop = asyncio.get_running_loop()
+        if not isinstance(data, list):
+            if is_write(data):
+                return await self.writer.submit(handle_single, self.blockchain, data)
+            return await loop.run_in_executor(self.readers, handle_single, self.blockchain, data)
+        if not data:
+            return rpc_error({}, 'Invalid Request: empty batch', -32600)
+        responses = await loop.run_in_executor(self.readers, handle_reads, self.blockchain, data, self.blockchain.view())
+        if any(is_write(entry) for entry in data):
+            responses.update(await self.writer.submit(handle_writes, self.blockchain, data))
+        return [responses[position] for position in range(len(data))]
+
+    def watch_jobs(self):
+        """Wake long-polling miners on the event loop whenever the job board changes, whatever thread changed it."""
+        loop = asyncio.get_running_loop()
+        self.job_changed = asyncio.Event()
+
+        def wake():
+            event, self.job_changed = self.job_changed, asyncio.Event()
+            event.set()
+
+        self.blockchain.job_board.subscribe(lambda version: loop.call_soon_threadsafe(wake))
+
+    async def poll_mining_job(self, scope):
+        """Wait for a job newer than the `version` query parameter, without holding a thread per miner."""
+        if self.job_changed is None:
+            self.watch_jobs()
+        query = parse_qs(scope.get('query_string', b'').decode())
+        known = int(query.get('version', ['-1'])[0])
+        timeout = min(float(query.get('timeout', [POLL_TIMEOUT])[0]), POLL_TIMEOUT)
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            event = self.job_changed  # taken before reading the version, so a change in between still wakes us
+            version, job, body = self.blockchain.job_board.current()
+            remaining = deadline - asyncio.get_running_loop().time()
+            if version != known or remaining <= 0:
+                return poll_response(version, self.blockchain.job_board.body_for(query.get('miner', [None])[0], body))
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def read_json(self, receive):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return json.loads(body)
+
+    async def respond_json(self, send, status, payload):
+        await self.respond(send, status, json.dumps(payload).encode(), b'application/json')
+
+    async def respond(self, send, status, body, content_type=b'text/plain'):
+        headers = [(b'content-type', content_type), (b'content-length', str(len(body)).encode())] + CORS_HEADERS
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+app = Node()
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("asgi.py needs an ASGI server, install one with `pip install uvicorn` or run main.py instead.")
+    uvicorn.run(app, host='0.0.0.0', port=8080, log_level='warning')
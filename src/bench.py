@@ -0,0 +1,351 @@
+"""
+Micro-benchmarks for the node internals.
+
+Usage: python3 bench.py [benchmark ...]
+Runs every benchmark when no name is given. Nothing here touches MongoDB or the
+local chain files, blockchains are built in memory.
+"""
+import hashlib
+import os
+import threading
+import json
+import sys
+import time
+import tracemalloc
+from block import Block
+from blockchain import Blockchain
+from transaction import tx_from_json
+from verifier import TxVerifier
+from mempool import Mempool
+from difficulty import Retarget, zeros_target
+from responsecache import ResponseCache
+from rpc import handle_rpc, encode_response
+from smartcontract import SmartContract, ContractManager
+from scheduler import ContractCall, ExecutionScheduler
+from eventlog import EventLog
+from worldstate import WorldState
+from utils import string_to_hex_with_prefix
+from vm import ExecutionContext, compile_method, run
+from errors import ExecutionError, InvalidExecutionData
+
+
+def offline_blockchain():
+    """Create a Blockchain with empty state without connecting to the database."""
+    blockchain = Blockchain.__new__(Blockchain)
+    blockchain.chain = []
+    blockchain.block_index = {}
+    blockchain.tx_index = {}
+    blockchain.tx_counts = {}
+    blockchain.mempool = Mempool()
+    blockchain.balances = {}
+    blockchain.published_view = None
+    blockchain.unpublished = (set(), set())
+    blockchain.retarget = Retarget(target=zeros_target(1))
+    blockchain.lock = threading.RLock()
+    blockchain.response_cache = ResponseCache()
+    blockchain.world_state = WorldState()
+    genesis = Block(0, "0", [], 0)
+    blockchain.chain.append(genesis)
+    blockchain.index_block(genesis)
+    return blockchain
+
+
+def grow_chain(blockchain, height):
+    """Append empty blocks until the chain has `height` blocks."""
+    while len(blockchain.chain) < height:
+        last = blockchain.chain[-1]
+        block = Block(last.index + 1, last.hash, [], 0)
+        blockchain.chain.append(block)
+        blockchain.index_block(block)
+
+
+def mine(previous_hash, txs, difficulty):
+    """Find a nonce for the given header, returns (nonce, hash)."""
+    prefix = f"{previous_hash}{json.dumps(txs)}"
+    target = '0' * difficulty
+    nonce = 0
+    while True:
+        block_hash = hashlib.blake2b(f"{prefix}{nonce}".encode(), digest_size=64).hexdigest()
+        if block_hash.startswith(target):
+            return nonce, block_hash
+        nonce += 1
+
+
+def bench_block_validation(sizes=(1000, 10000, 100000, 1000000), rounds=2000):
+    """Time validate_mined_block as the chain grows, it should stay flat."""
+    blockchain = offline_blockchain()
+    print("validate_mined_block")
+    for size in sizes:
+        grow_chain(blockchain, size)
+        last = blockchain.get_last_block()
+        nonce, block_hash = mine(last.hash, [], 1)
+        candidate = {
+            'index': last.index + 1,
+            'previous_hash': last.hash,
+            'transactions': [],
+            'difficulty': 1,
+            'hash': block_hash,
+        }
+        start = time.perf_counter()
+        for _ in range(rounds):
+            blockchain.validate_mined_block(candidate, nonce)
+        elapsed = time.perf_counter() - start
+        print(f"  {size:>9} blocks: {elapsed / rounds * 1e6:8.2f} us per validation")
+
+
+def bench_chain_memory(tx_count=1000000, per_block=10):
+    """Report the memory held per transaction by an in-memory chain rebuilt from JSON."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    chain = []
+    previous_hash = "0"
+    for index in range(tx_count // per_block):
+        txs = [tx_from_json({
+            'sender': f"0x{index:040x}",
+            'recipient': f"0x{position:040x}",
+            'amount': 10**18,
+            'nonce': position,
+            'timestamp': 1700000000.0 + index,
+            'hash': hashlib.sha256(f"{index}:{position}".encode()).hexdigest(),
+        }) for position in range(per_block)]
+        block = Block(index, previous_hash, txs, 0)
+        block.hash = hashlib.blake2b(str(index).encode(), digest_size=64).hexdigest()
+        previous_hash = block.hash
+        chain.append(block)
+    elapsed = time.perf_counter() - start
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print("in-memory chain")
+    print(f"  {tx_count} txs in {len(chain)} blocks, built in {elapsed:.2f}s")
+    print(f"  {used / tx_count:8.1f} bytes per transaction (including its block share)")
+
+
+def signed_raw_transactions(count):
+    """Sign `count` plain transfers with throwaway keys."""
+    from eth_account import Account
+    from web3 import Web3
+    raws = []
+    for nonce in range(count):
+        account = Account.create()
+        signed = account.sign_transaction({
+            'nonce': 0,
+            'gasPrice': 1,
+            'gas': 10**16,
+            'to': Web3.to_checksum_address(f"0x{nonce:040x}"),
+            'value': 10**18,
+            'data': b'',
+            'chainId': 6934,
+        })
+        raw = getattr(signed, 'raw_transaction', None) or signed.rawTransaction
+        raws.append('0x' + bytes(raw).hex())
+    return raws
+
+
+def bench_signature_recovery(count=2000):
+    """Decode and recover senders of a batch of raw txs, scaling the verifier's worker count."""
+    raws = signed_raw_transactions(count)
+    print("raw transaction verification")
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        verifier = TxVerifier(workers)
+        verifier.verify_batch(raws[:workers * 2])  # start the pool outside the timing
+        start = time.perf_counter()
+        results = verifier.verify_batch(raws)
+        elapsed = time.perf_counter() - start
+        verifier.shutdown()
+        failed = sum(1 for tx_dict, error in results if error)
+        print(f"  {workers:>3} workers: {count / elapsed:10.1f} txs/sec ({failed} failed)")
+        workers *= 2
+
+
+def bench_response_cache(blocks=1000, per_block=10, rounds=20000):
+    """Serve eth_getBlockByNumber for old blocks with a cold and with a warm response cache."""
+    blockchain = offline_blockchain()
+    for index in range(1, blocks):
+        txs = [tx_from_json({
+            'sender': f"0x{index:040x}",
+            'recipient': f"0x{position:040x}",
+            'amount': 10**18,
+            'nonce': position,
+            'timestamp': 1700000000.0 + index,
+            'hash': hashlib.sha256(f"{index}:{position}".encode()).hexdigest(),
+        }) for position in range(per_block)]
+        block = Block(index, blockchain.chain[-1].hash, txs, 0)
+        blockchain.chain.append(block)
+        blockchain.index_block(block)
+    blockchain.publish_view()
+    requests = [{'jsonrpc': '2.0', 'id': i, 'method': 'eth_getBlockByNumber', 'params': [hex(i % blocks), True]}
+                for i in range(rounds)]
+    print("eth_getBlockByNumber")
+    for label, clear in (("cold", True), ("warm", False)):
+        start = time.perf_counter()
+        for data in requests:
+            if clear:
+                blockchain.response_cache.clear()
+            encode_response(handle_rpc(blockchain, data))
+        elapsed = time.perf_counter() - start
+        print(f"  {label}: {rounds / elapsed:10.1f} requests/sec")
+    print(f"  cache: {blockchain.response_cache.stats()}")
+
+
+def interpret(contract, instructions, args):
+    """
+    The if/elif loop SmartContract.execute ran before methods were compiled, kept as the
+    baseline of bench_contract_vm. It splits and compares every instruction on every call.
+    """
+    stack = []
+    for instruction in instructions:
+        parts = instruction.split(" ")
+        op = str(parts[0].strip())
+
+        if op == "PUSH_ARG":
+            arg_name = parts[1]
+            if arg_name not in args:
+                raise InvalidExecutionData(f"Missing argument for {instruction}")
+            stack.append(args[arg_name])
+
+        elif op == "PUSH":
+            value = parts[1]
+            stack.append(value)
+
+        elif op == "SET":
+            key = parts[1]
+            value = stack.pop()
+            result = contract.set(key, value)
+            stack.append(result)
+
+        elif op == "GET":
+            key = parts[1]
+            stack.append(contract.get(key))
+
+        elif op == "SEND_TX":
+            recipient_var = parts[1]
+            amount_var = parts[2]
+            recipient = contract.get(recipient_var)
+            amount = contract.get(amount_var)
+            if recipient is None or amount is None:
+                raise ExecutionError(f"Undefined variable(s) in SEND_TX: {recipient_var}, {amount_var}")
+            result = contract.send_funds(recipient, amount)
+            stack.append(result)
+
+        elif op == "GET_BALANCE":
+            stack.append(contract.balance())
+
+        elif op == "EMIT_EVENT":
+            event_name = contract.get(parts[1])
+            data = contract.get(parts[2])
+            if event_name is None or data is None:
+                raise ExecutionError(f"Event name '{event_name}' or data '{data}' is not defined.")
+            result = contract.emit_event(event_name, data)
+            stack.append(result)
+
+        elif op in ["ADD", "SUB", "MUL", "DIV", "MOD", "LT", "GT"]:
+            b = stack.pop()
+            a = stack.pop()
+            if op == "ADD":
+                stack.append(a + b)
+            elif op == "SUB":
+                stack.append(a - b)
+            elif op == "MUL":
+                stack.append(a * b)
+            elif op == "DIV":
+                if b == 0:
+                    raise ZeroDivisionError("Division by zero")
+                stack.append(a / b)
+            elif op == "MOD":
+                if b == 0:
+                    raise ZeroDivisionError("Division by zero in modulus operation")
+                stack.append(a % b)
+            elif op == "LT":
+                stack.append(1 if a < b else 0)
+            elif op == "GT":
+                stack.append(1 if a > b else 0)
+
+        else:
+            raise ExecutionError(f"Unknown opcode: {op}")
+
+
+def bench_contract_vm(calls=2000):
+    """
+    Instructions/sec of a contract method on the if/elif interpreter it used to run on, and on
+    the table-dispatch VM compiled on every call and compiled once.
+    """
+    blockchain = offline_blockchain()
+    blockchain.contract_manager = ContractManager(blockchain)
+    contract = SmartContract.__new__(SmartContract)
+    contract.owner, contract.state, contract.blockchain, contract.locked = f"0x{1:040x}", {'total': 0}, blockchain, False
+    contract.address, contract.methods = f"0x{2:040x}", {}
+    blockchain.contract_manager.add(contract)
+    instructions = []
+    for _ in range(20):
+        instructions += ["GET total", "PUSH_ARG amount", "ADD", "SET total", "GET total", "PUSH_ARG amount", "LT"]
+    args = {'amount': 3}
+    program = compile_method(instructions)
+    cases = (
+        ("if/elif interpreter", lambda: interpret(contract, instructions, args)),
+        ("compiled per call", lambda: run(compile_method(instructions), ExecutionContext(contract, args))),
+        ("compiled once", lambda: run(program, ExecutionContext(contract, args))),
+    )
+    print(f"contract method ({len(instructions)} instructions)")
+    for label, call in cases:
+        start = time.perf_counter()
+        for _ in range(calls):
+            call()
+        elapsed = time.perf_counter() - start
+        print(f"  {label}: {calls * len(instructions) / elapsed:12.0f} instructions/sec")
+
+
+def bench_contract_scheduler(calls=2000):
+    """
+    Calls/sec of a batch run one by one and through the scheduler with 1, 2, 4... workers, on
+    distinct contracts and on a single one. Speculation can only gain on a free-threaded build,
+    with the GIL the extra workers show what it costs.
+    """
+    blockchain = offline_blockchain()
+    blockchain.contract_manager = ContractManager(blockchain)
+    blockchain.event_log = EventLog(None, None)
+    owner = f"0x{1:040x}"
+    for i in range(calls):
+        contract = SmartContract.__new__(SmartContract)
+        contract.owner, contract.state, contract.blockchain, contract.locked = owner, {'total': 0}, blockchain, False
+        contract.native_methods = []
+        contract.address = f"0x{i + 2:040x}"
+        contract.methods = {'bump': ["GET total", "PUSH_ARG amount", "ADD", "SET total"] * 50}
+        blockchain.contract_manager.add(contract)
+    data = string_to_hex_with_prefix('bump|XYL|{"amount": 1}')
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f"contract call batches ({calls} calls, {'GIL' if gil else 'free-threaded'}, {os.cpu_count()} cpus)")
+    worker_counts = [1]
+    while worker_counts[-1] < (os.cpu_count() or 1):
+        worker_counts.append(worker_counts[-1] * 2)
+    if len(worker_counts) == 1:
+        worker_counts.append(2)  # still show what speculating costs on a single core
+    for label, spread in (("distinct contracts", calls), ("one contract", 1)):
+        batch = [ContractCall(f"0x{i % spread + 2:040x}", data, owner, None, str(i)) for i in range(calls)]
+        start = time.perf_counter()
+        for call in batch:
+            blockchain.contract_manager.get(call.contract_address).execute(blockchain, data, owner)
+        print(f"  {label}: {calls / (time.perf_counter() - start):10.0f} calls/sec one by one")
+        for workers in worker_counts:
+            scheduler = ExecutionScheduler(blockchain, workers)
+            start = time.perf_counter()
+            scheduler.execute(batch)
+            scheduled = calls / (time.perf_counter() - start)
+            scheduler.shutdown()
+            print(f"  {label}: {scheduled:10.0f} calls/sec scheduled on {workers} workers ({scheduler.reexecuted} re-executed)")
+
+
+BENCHMARKS = {
+    'validation': bench_block_validation,
+    'memory': bench_chain_memory,
+    'signatures': bench_signature_recovery,
+    'rpccache': bench_response_cache,
+    'contracts': bench_contract_vm,
+    'scheduler': bench_contract_scheduler,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -3,7 +3,22 @@ import time
 import json
 import traceback
 from errors import *
+NOT_COMPUTED = object()  # marks a lazily computed field that hasn't been computed yet
+
+def mining_hash(previous_hash, transactions, nonce):
+    """
+    Proof-of-work hash of a mined block: blake2b over the previous hash, the JSON of the
+    block's transactions and the nonce.
+
+    :param transactions: Transactions as JSON dicts, in block order.
+    :return: Hex digest (64-byte blake2b).
+    """
+    block_header = f"{previous_hash}{json.dumps(transactions)}{nonce}"
+    return hashlib.blake2b(block_header.encode(), digest_size=64).hexdigest()
+
 class Block:
+    __slots__ = ('index', 'previous_hash', 'timestamp', 'transactions', 'nonce', 'state_root', '_merkle_root', '_hash')
+
     def __init__(self, index, previous_hash, transactions, nonce=0):
         """
         Initializes a new block.
@@ -18,8 +33,49 @@ class Block:
         self.timestamp = time.time()  # Current timestamp in seconds
         self.transactions = transactions  # List of transaction objects
         self.nonce = int(nonce)  # Used for Proof of Work
-        self.merkle_root = self.compute_merkle_root()  # Root hash of transactions
-        self.hash = self.compute_hash()  # Block hash
+        self.state_root = None  # Root of the world state after this block, see worldstate.WorldState
+        self._merkle_root = NOT_COMPUTED  # Root hash of transactions, computed on first access
+        self._hash = NOT_COMPUTED  # Block hash, computed on first access
+
+    @property
+    def merkle_root(self):
+        if self._merkle_root is NOT_COMPUTED:
+            self._merkle_root = self.compute_merkle_root()
+        return self._merkle_root
+
+    @merkle_root.setter
+    def merkle_root(self, value):
+        self._merkle_root = value
+
+    @property
+    def hash(self):
+        if self._hash is NOT_COMPUTED:
+            self._hash = self.compute_hash()
+        return self._hash
+
+    @hash.setter
+    def hash(self, value):
+        self._hash = value
+
+    def __getstate__(self):
+        """Pickle the plain field values, the same layout older __dict__ based blocks used."""
+        return {
+            'index': self.index,
+            'previous_hash': self.previous_hash,
+            'timestamp': self.timestamp,
+            'transactions': self.transactions,
+            'nonce': self.nonce,
+            'state_root': self.state_root,
+            'merkle_root': self.merkle_root,
+            'hash': self.hash
+        }
+
+    def __setstate__(self, state):
+        self._merkle_root = NOT_COMPUTED
+        self._hash = NOT_COMPUTED
+        self.state_root = None  # blocks pickled before state roots existed
+        for name, value in state.items():
+            setattr(self, name, value)
 
     def compute_hash(self):
         """
@@ -75,6 +131,7 @@ class Block:
             'transactions': [tx.__json__() for tx in self.transactions],
             'nonce': self.nonce,
             'merkle_root': self.merkle_root,
+            'state_root': self.state_root,
             'hash': self.hash,
             'timestamp': self.timestamp
         }
@@ -0,0 +1,199 @@
+import json
+import mmap
+import os
+import struct
+from block import Block
+from transaction import tx_from_json
+
+RECENT_BLOCKS = 1024  # blocks kept as objects at the tip of the chain
+
+
+class Column:
+    """Append-only file of fixed-width records, read through a memory map."""
+
+    def __init__(self, path, fmt):
+        self.struct = struct.Struct(fmt)
+        self.file = open(path, 'ab+')
+        self.count = os.path.getsize(path) // self.struct.size
+        self.map = None
+        self.mapped = 0  # records visible through the current map
+
+    def truncate(self, count):
+        """Drop records past `count`, used to repair columns left uneven by a crash."""
+        self.close_map()
+        self.file.truncate(count * self.struct.size)
+        self.count = count
+
+    def append(self, *values):
+        self.file.write(self.struct.pack(*values))
+        self.count += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i >= self.mapped:
+            self.remap()
+        return self.struct.unpack_from(self.map, i * self.struct.size)
+
+    def remap(self):
+        # The old map is left for the garbage collector rather than closed, a reader on another
+        # thread may still be unpacking from it.
+        self.file.flush()
+        if self.count:
+            new_map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.map = new_map
+            self.mapped = len(new_map) // self.struct.size
+
+    def close_map(self):
+        if self.map is not None:
+            self.map.close()
+        self.map = None
+        self.mapped = 0
+
+
+class BlockStore:
+    """
+    List-like container for the chain.
+
+    The newest blocks stay as Block objects. Older ones are moved into memory-mapped columns
+    of indices, timestamps, hashes and payload offsets, with the rest of each block (previous
+    hash, nonce, merkle root, transactions) as JSON in a payload file. Archived blocks are
+    rebuilt on access, so resident memory stays bounded by the recent window and whatever
+    the OS keeps of the maps. The store survives restarts, only blocks past its end need to
+    be appended again.
+
+    Readers don't lock: the archived count and the recent window are published together as
+    one `tip` tuple, replaced whole after a block is archived, so a reader always sees a block
+    either in the window or in the columns.
+    """
+
+    def __init__(self, directory, recent=RECENT_BLOCKS):
+        os.makedirs(directory, exist_ok=True)
+        self.recent_limit = recent
+        self.indices = Column(os.path.join(directory, 'index.col'), '<q')
+        self.timestamps = Column(os.path.join(directory, 'timestamp.col'), '<d')
+        self.hashes = Column(os.path.join(directory, 'hash.col'), '<B64s')  # digest length, raw digest
+        self.tx_offsets = Column(os.path.join(directory, 'txoffset.col'), '<qq')  # payload offset, length
+        self.payload = open(os.path.join(directory, 'payload.dat'), 'ab+')
+        self.payload_map = None
+        self.columns = [self.indices, self.timestamps, self.hashes, self.tx_offsets]
+        archived = min(len(column) for column in self.columns)
+        for column in self.columns:
+            column.truncate(archived)  # also drops a partial record torn off by a crash
+        self.tip = (archived, [])  # (blocks in the columns, recent Block objects)
+        if archived:
+            try:
+                self.load_archived(archived - 1)
+            except Exception:
+                print("Block store is damaged, it will be rebuilt.")
+                self.clear()
+
+    def __len__(self):
+        archived, recent = self.tip
+        return archived + len(recent)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        archived, recent = self.tip
+        if i < 0:
+            i += archived + len(recent)
+        if i < 0 or i >= archived + len(recent):
+            raise IndexError("block index out of range")
+        if i >= archived:
+            return recent[i - archived]
+        return self.load_archived(i)
+
+    def hash_at(self, i):
+        """Hash of the block at position i, without rebuilding archived blocks."""
+        archived, recent = self.tip
+        if i < 0:
+            i += archived + len(recent)
+        if i >= archived:
+            return recent[i - archived].hash
+        length, digest = self.hashes[i]
+        return digest[:length].hex()
+
+    def append(self, block):
+        self.extend([block])
+
+    def extend(self, blocks):
+        archived, recent = self.tip
+        moved = False
+        for block in blocks:
+            if block.index != archived + len(recent):
+                raise ValueError(f"Block {block.index} appended at height {archived + len(recent)}")
+            recent = recent + [block]
+            while len(recent) > self.recent_limit:
+                self.archive(recent[0])  # in the columns before it leaves the window
+                archived, recent = archived + 1, recent[1:]
+                moved = True
+            self.tip = (archived, recent)
+        if moved:
+            for column in self.columns:
+                column.flush()
+
+    def clear(self):
+        """Drop every block, archived ones included."""
+        for column in self.columns:
+            column.truncate(0)
+        self.close_payload_map()
+        self.payload.truncate(0)
+        self.tip = (0, [])
+
+    def archive(self, block):
+        payload = json.dumps({
+            'previous_hash': block.previous_hash,
+            'nonce': block.nonce,
+            'merkle_root': block.merkle_root,
+            'state_root': block.state_root,
+            'transactions': [tx.__json__() for tx in block.transactions],
+        }).encode()
+        self.payload.seek(0, os.SEEK_END)
+        offset = self.payload.tell()
+        self.payload.write(payload)
+        self.payload.flush()  # payload goes to disk before the columns that point at it
+        digest = bytes.fromhex(block.hash)
+        self.indices.append(block.index)
+        self.timestamps.append(block.timestamp)
+        self.hashes.append(len(digest), digest)
+        self.tx_offsets.append(offset, len(payload))
+
+    def load_archived(self, i):
+        offset, length = self.tx_offsets[i]
+        payload_map = self.payload_map
+        if payload_map is None or offset + length > len(payload_map):
+            self.remap_payload()
+            payload_map = self.payload_map
+        entry = json.loads(payload_map[offset:offset + length])
+        block = Block(index=self.indices[i][0],
+                      previous_hash=entry['previous_hash'],
+                      transactions=[tx_from_json(tx) for tx in entry['transactions']],
+                      nonce=entry['nonce'])
+        block.timestamp = self.timestamps[i][0]
+        block.merkle_root = entry['merkle_root']
+        block.state_root = entry.get('state_root')
+        block.hash = self.hash_at(i)
+        return block
+
+    def remap_payload(self):
+        self.payload.flush()  # old map left to the garbage collector, see Column.remap
+        self.payload_map = mmap.mmap(self.payload.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close_payload_map(self):
+        if self.payload_map is not None:
+            self.payload_map.close()
+        self.payload_map = None
+
+    def flush(self):
+        for column in self.columns:
+            column.flush()
+        self.payload.flush()
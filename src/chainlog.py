@@ -0,0 +1,106 @@
+import os
+from crypt_util import append_encrypted_record, iter_encrypted_records, record_offsets, read_encrypted_record, ep_save, ep_load
+
+COMPACT_EVERY = 1000  # blocks per sealed segment
+
+
+class ChainLog:
+    """
+    Append-only, encrypted on-disk log of the chain.
+
+    Every accepted block is encrypted on its own, under the file's derived key like any ep_save
+    file, and appended to `active.log`, so persisting a block costs the same at any chain
+    height. Once the active log holds COMPACT_EVERY blocks
+    it is compacted into a sealed segment `<first>-<last>.seg`, an indexed ep_save list from
+    which single blocks can be read without decrypting the rest.
+    """
+
+    def __init__(self, directory, key, compact_every=COMPACT_EVERY):
+        self.directory = directory
+        self.key = key
+        self.compact_every = compact_every
+        self.active = os.path.join(directory, 'active.log')
+        self.last_index = -1  # index of the newest persisted block
+        self.active_count = 0  # records in the active log
+        if self.exists():
+            self.open()
+
+    def exists(self):
+        return os.path.isdir(self.directory) and (bool(self.segments()) or os.path.exists(self.active))
+
+    def segments(self):
+        """Sealed segment files as (first index, last index, path), oldest first."""
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.seg'):
+                first, last = name[:-4].split('-')
+                segments.append((int(first), int(last), os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    def open(self):
+        """Find the newest persisted block without replaying the log."""
+        segments = self.segments()
+        if segments:
+            self.last_index = segments[-1][1]
+        if os.path.exists(self.active):
+            offsets = record_offsets(self.active)
+            self.active_count = len(offsets)
+            if offsets:
+                self.last_index = max(self.last_index, read_encrypted_record(self.active, self.key, offsets[-1]).index)
+
+    def append(self, block):
+        """Persist one block, compacting the active log when it is full."""
+        os.makedirs(self.directory, exist_ok=True)
+        append_encrypted_record(block, self.active, self.key)
+        self.last_index = block.index
+        self.active_count += 1
+        if self.active_count >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Seal the active log into a single-record segment."""
+        if not os.path.exists(self.active):
+            return
+        blocks = list(iter_encrypted_records(self.active, self.key))
+        if blocks:
+            name = f"{blocks[0].index:012d}-{blocks[-1].index:012d}.seg"
+            path = os.path.join(self.directory, name)
+            ep_save(blocks, path, self.key)  # written atomically, a crash before it lands leaves the active log intact
+        os.remove(self.active)
+        self.active_count = 0
+
+    def iter_blocks(self, start=0):
+        """
+        Yield persisted blocks in order, from index `start` on. Segments that end before `start`
+        are skipped without decrypting them, and blocks duplicated by an interrupted compaction
+        are skipped.
+        """
+        expected = start
+        for first, last, path in self.segments():
+            if last < expected:
+                continue
+            for block in ep_load(path, self.key):
+                if block.index == expected:
+                    expected += 1
+                    yield block
+        if os.path.exists(self.active):
+            for block in iter_encrypted_records(self.active, self.key):
+                if block.index == expected:
+                    expected += 1
+                    yield block
+
+    def read_block(self, index):
+        """Read a single persisted block, decrypting only its own record when it is in a sealed segment."""
+        for first, last, path in self.segments():
+            if first <= index <= last:
+                return ep_load(path, self.key, record=index - first)
+        if not os.path.exists(self.active):  # e.g. right after a compaction
+            return None
+        for block in iter_encrypted_records(self.active, self.key):
+            if block.index == index:
+                return block
+        return None
+
+    def replay(self):
+        """Load every persisted block in order."""
+        return list(self.iter_blocks())
@@ -0,0 +1,139 @@
+import json
+from collections.abc import Mapping
+from errors import *
+
+
+class LayeredMap(Mapping):
+    """
+    Immutable mapping built from layers of changes, newest last, used for the balances and
+    transaction counts of views.
+
+    updated() adds the changes of one block as a new layer instead of copying the whole map.
+    Whenever the newest layer is at least half the size of the one below, the two are merged
+    into a new dict, so layer sizes shrink geometrically: there are O(log n) layers, a key is
+    copied O(log n) times on average, and published maps are never modified. Keys can't be
+    removed, balances and transaction counts never are.
+    """
+
+    def __init__(self, layers=()):
+        self.layers = layers  # tuple of dicts, oldest and largest first
+
+    def updated(self, changes):
+        """New map with `changes` (a dict the caller no longer touches) applied over this one."""
+        if not changes:
+            return self
+        layers = list(self.layers) + [changes]
+        while len(layers) > 1 and len(layers[-1]) * 2 >= len(layers[-2]):
+            top = layers.pop()
+            layers[-1] = {**layers[-1], **top}
+        return LayeredMap(tuple(layers))
+
+    def __getitem__(self, key):
+        for layer in reversed(self.layers):
+            if key in layer:
+                return layer[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        for layer in reversed(self.layers):
+            if key in layer:
+                return layer[key]
+        return default
+
+    def __iter__(self):
+        seen = set()
+        for layer in reversed(self.layers):
+            for key in layer:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class ChainView:
+    """
+    Read-only view of the chain at a fixed height.
+
+    Blocks are only ever appended, so capping lookups at `height` is enough to hide blocks
+    accepted after the view was taken, even though the chain and its indexes are shared with
+    the writer. Balances and transaction counts are LayeredMaps holding the values at that
+    height, so nothing a reader can see through a view changes once it is published.
+    """
+
+    def __init__(self, blockchain, height, balances, tx_counts):
+        self.blockchain = blockchain
+        self.height = height
+        self.balances = balances
+        self.tx_counts = tx_counts
+
+    def chain_height(self):
+        """Number of blocks visible to this view."""
+        return self.height
+
+    def block_number(self):
+        return self.chain_height() - 1
+
+    def get_balance(self, address: str):
+        return int(self.balances.get(address.lower(), 0))
+
+    def get_transaction_count(self, address: str, pending=False):
+        """
+        Mined transactions sent by the address at this view's height. With `pending`, plus its
+        transactions in the mempool as they are now, which is the next nonce it can use.
+        """
+        address = address.lower()
+        count = self.tx_counts.get(address, 0)
+        if pending:
+            count += self.blockchain.mempool.pending_count(address)
+        return count
+
+    def get_block(self, number):
+        if number < 0 or number >= self.chain_height():
+            return None
+        return self.blockchain.chain[number]
+
+    def get_block_by_hash(self, block_hash):
+        index = self.blockchain.block_index.get(str(block_hash))
+        if index is None:
+            return None
+        return self.get_block(index)
+
+    def find_transaction(self, tx_hash):
+        location = self.blockchain.tx_index.get(tx_hash)
+        if location is None or location[0] >= self.chain_height():
+            return None, None
+        return self.blockchain.chain[location[0]], location[1]
+
+    def get_transaction_by_hash(self, tx_hash):
+        block, position = self.find_transaction(tx_hash)
+        if block is None:
+            return None
+        return self.blockchain.transaction_json(block, position)
+
+    def get_transaction_receipt(self, tx_hash):
+        """Receipt of a mined transaction or of a contract call, None if it is pending or unknown."""
+        block, position = self.find_transaction(tx_hash)
+        if block is None:
+            return self.blockchain.execution_receipt(tx_hash)
+        return self.blockchain.transaction_receipt(block, position)
+
+    def block_json(self, number):
+        """Serialized JSON of a block, cached once built since mined blocks never change. None if not visible."""
+        if number < 0 or number >= self.chain_height():
+            return None
+        return self.blockchain.response_cache.get(('block', number), lambda: json.dumps(self.get_block(number).__json__()).encode())
+
+    def block_json_by_hash(self, block_hash):
+        index = self.blockchain.block_index.get(str(block_hash))
+        if index is None:
+            return None
+        return self.block_json(index)
+
+    def transaction_json(self, tx_hash):
+        """Serialized JSON of a mined transaction, cached like blocks. None if pending or unknown."""
+        location = self.blockchain.tx_index.get(tx_hash)
+        if location is None or location[0] >= self.chain_height():
+            return None
+        return self.blockchain.response_cache.get(('tx', tx_hash), lambda: json.dumps(self.get_transaction_by_hash(tx_hash)).encode())
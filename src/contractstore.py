@@ -0,0 +1,56 @@
+import os
+from crypt_util import ep_save, ep_load
+
+CONTRACTS_DIR = 'contracts'
+
+
+class ContractStore:
+    """
+    Contracts on disk, keyed by address.
+
+    Every contract has two records in `directory`: `<address>.code` with its owner, lock and
+    methods, and `<address>.state` with its state dict. Both are ep_save files encrypted under
+    their own key derived from CONTRACT_KEY. State changes with nearly every call while code only
+    changes with the owner or the lock, so each is rewritten on its own. Opening the store only
+    lists file names, records are read when a contract is first used.
+    """
+
+    def __init__(self, directory, key):
+        self.directory = directory
+        self.key = key
+        self.addresses = set()
+        if os.path.isdir(directory):
+            self.addresses = {name[:-len('.code')] for name in os.listdir(directory) if name.endswith('.code')}
+
+    def __contains__(self, address):
+        return address in self.addresses
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def path(self, address, kind):
+        return os.path.join(self.directory, f"{address}.{kind}")
+
+    def load(self, address):
+        """(code record, state) of a contract, None if it isn't stored."""
+        if address not in self.addresses:
+            return None
+        code = ep_load(self.path(address, 'code'), self.key)
+        state_path = self.path(address, 'state')
+        state = ep_load(state_path, self.key) if os.path.exists(state_path) else {}
+        return code, state
+
+    def write_code(self, address, code):
+        os.makedirs(self.directory, exist_ok=True)
+        ep_save(code, self.path(address, 'code'), self.key)
+        self.addresses.add(address)
+
+    def write_state(self, address, state):
+        os.makedirs(self.directory, exist_ok=True)
+        ep_save(state, self.path(address, 'state'), self.key)
+
+    def delete(self, address):
+        for kind in ('code', 'code.idx', 'state', 'state.idx'):
+            if os.path.exists(self.path(address, kind)):
+                os.remove(self.path(address, kind))
+        self.addresses.discard(address)
@@ -1,38 +1,278 @@
 import os
+import mmap
+import base64
 import pickle
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 import traceback
 
-def save_encrypted_object(data, filename, key):
+MAGIC = b'XYLENC1\n'  # marks the chunked format, files without it are single Fernet blobs
+KIND_OBJECT = b'O'  # one pickle, split into encrypted chunks
+KIND_LIST = b'L'  # one encrypted record per item
+KIND_DICT = b'D'  # one encrypted record per (key, value) pair
+CHUNK_SIZE = 1 << 20  # plaintext bytes per chunk of a KIND_OBJECT file
+
+def derive_key(key, filename):
+    """
+    Derives the Fernet key of a single file from a master key (e.g. KEY or CONTRACT_KEY),
+    so every file is encrypted under its own key.
+
+    :param key: The master Fernet key.
+    :param filename: Path of the file, only its base name is used.
+    :return: A Fernet key (bytes).
+    """
+    master = base64.urlsafe_b64decode(key)
+    info = b'xyl-storage:' + os.path.basename(filename).encode()
+    derived = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info).derive(master)
+    return base64.urlsafe_b64encode(derived)
+
+def record_fernet(key, filename):
+    """
+    Fernet of a record file: encrypts under the file's derived key, and also decrypts records
+    appended under the master key itself, as record files were before they had their own key.
+    """
+    return MultiFernet([Fernet(derive_key(key, filename)), Fernet(key)])
+
+def frame(token):
+    return len(token).to_bytes(4, 'big') + token
+
+def read_frame(view, offset):
+    """Returns (token, offset of the next record) for the record at offset of a buffer."""
+    length = int.from_bytes(view[offset:offset + 4], 'big')
+    return bytes(view[offset + 4:offset + 4 + length]), offset + 4 + length
+
+class EncryptedChunkWriter:
+    """File-like object for pickle.Pickler that encrypts and writes fixed-size chunks."""
+
+    def __init__(self, f, fernet, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.fernet = fernet
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            self.f.write(frame(self.fernet.encrypt(bytes(self.buffer[:self.chunk_size]))))
+            del self.buffer[:self.chunk_size]
+        return len(data)
+
+    def close(self):
+        if self.buffer:
+            self.f.write(frame(self.fernet.encrypt(bytes(self.buffer))))
+            self.buffer = bytearray()
+
+class EncryptedChunkReader:
+    """File-like object for pickle.Unpickler that decrypts chunks as they are needed."""
+
+    def __init__(self, view, offset, fernet):
+        self.view = view
+        self.offset = offset
+        self.fernet = fernet
+        self.buffer = b''
+        self.position = 0
+
+    def fill(self, size):
+        while len(self.buffer) - self.position < size and self.offset < len(self.view):
+            token, self.offset = read_frame(self.view, self.offset)
+            self.buffer = self.buffer[self.position:] + self.fernet.decrypt(token)
+            self.position = 0
+
+    def read(self, size=-1):
+        if size < 0:
+            size = len(self.view)  # more than is left
+        self.fill(size)
+        data = self.buffer[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+    def readline(self):
+        line = b''
+        while not line.endswith(b'\n'):
+            self.fill(1)
+            if self.position >= len(self.buffer):
+                break
+            end = self.buffer.find(b'\n', self.position)
+            end = len(self.buffer) if end == -1 else end + 1
+            line += self.buffer[self.position:end]
+            self.position = end
+        return line
+
+def save_encrypted_object(data, filename, key, indexed=True):
     """
     Encrypts and saves an object to a file using Fernet symmetric encryption.
 
+    Lists and dicts are written one encrypted record per item, with an encrypted offset index
+    next to the file (`<filename>.idx`) so single items can be read back on their own. Other
+    objects, and lists and dicts saved with indexed=False, are pickled straight into encrypted
+    chunks. Either way the data is streamed, nothing holds the whole serialized file in memory
+    at once.
+
     :param data: The Python object to save.
     :param filename: Path to the file where the encrypted object will be saved.
-    :param key: The encryption key (bytes) used for Fernet.
+    :param key: The master encryption key (bytes), the file key is derived from it.
+    :param indexed: False for lists and dicts that are only ever loaded whole, one encryption
+        per chunk instead of one per item.
     """
-    fernet = Fernet(key)
-    serialized_data = pickle.dumps(data)  # Serialize the object
-    encrypted_data = fernet.encrypt(serialized_data)  # Encrypt the serialized data
+    fernet = Fernet(derive_key(key, filename))
+    if isinstance(data, dict) and indexed:
+        kind, items, offsets = KIND_DICT, data.items(), {}
+    elif isinstance(data, list) and indexed:
+        kind, items, offsets = KIND_LIST, data, []
+    else:
+        kind, items, offsets = KIND_OBJECT, None, None
+
+    with open(filename + '.tmp', 'wb') as f:
+        f.write(MAGIC + kind)
+        if kind == KIND_OBJECT:
+            writer = EncryptedChunkWriter(f, fernet)
+            pickle.Pickler(writer).dump(data)
+            writer.close()
+        else:
+            for item in items:
+                offset = f.tell()
+                f.write(frame(fernet.encrypt(pickle.dumps(item))))
+                if kind == KIND_DICT:
+                    offsets[item[0]] = offset
+                else:
+                    offsets.append(offset)
+        size = f.tell()
+
+    if offsets is not None:
+        index = {'size': size, 'offsets': offsets}
+        with open(filename + '.idx.tmp', 'wb') as f:
+            f.write(fernet.encrypt(pickle.dumps(index)))
+        os.replace(filename + '.idx.tmp', filename + '.idx')
+    os.replace(filename + '.tmp', filename)
 
-    with open(filename, 'wb') as f:
-        f.write(encrypted_data)
+def load_offset_index(filename, fernet, view, kind):
+    """Loads the offset index of a file, rebuilding it by a scan if it is missing or stale."""
+    try:
+        with open(filename + '.idx', 'rb') as f:
+            index = pickle.loads(fernet.decrypt(f.read()))
+        if index['size'] == len(view):
+            return index['offsets']
+    except Exception:
+        pass  # rebuilt below
+    offsets = {} if kind == KIND_DICT else []
+    offset = len(MAGIC) + 1
+    while offset < len(view):
+        token, next_offset = read_frame(view, offset)
+        if kind == KIND_DICT:
+            offsets[pickle.loads(fernet.decrypt(token))[0]] = offset
+        else:
+            offsets.append(offset)
+        offset = next_offset
+    return offsets
 
-def load_encrypted_object(filename, key):
+def load_encrypted_object(filename, key, record=None):
     """
     Loads and decrypts an object from an encrypted file using Fernet symmetric encryption.
 
     :param filename: Path to the file where the encrypted object is stored.
-    :param key: The decryption key (bytes) used for Fernet.
-    :return: The decrypted and deserialized Python object.
+    :param key: The master decryption key (bytes).
+    :param record: Optional list position or dict key, only that item is decrypted and returned.
+    :return: The decrypted and deserialized Python object, or the requested item.
+    """
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:  # single Fernet blob written by older versions
+            f.seek(0)
+            data = pickle.loads(Fernet(key).decrypt(f.read()))
+            return data if record is None else data[record]
+        kind = f.read(1)
+        fernet = Fernet(derive_key(key, filename))
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            start = len(MAGIC) + 1
+            if kind == KIND_OBJECT:
+                return pickle.Unpickler(EncryptedChunkReader(view, start, fernet)).load()
+
+            if record is not None:
+                offsets = load_offset_index(filename, fernet, view, kind)
+                token, _ = read_frame(view, offsets[record])
+                item = pickle.loads(fernet.decrypt(token))
+                return item[1] if kind == KIND_DICT else item
+
+            data = {} if kind == KIND_DICT else []
+            offset = start
+            while offset < len(view):
+                token, offset = read_frame(view, offset)
+                item = pickle.loads(fernet.decrypt(token))
+                if kind == KIND_DICT:
+                    data[item[0]] = item[1]
+                else:
+                    data.append(item)
+            return data
+
+def append_encrypted_record(data, filename, key):
+    """
+    Encrypts a single object and appends it to a record file.
+
+    Each record is a 4-byte big-endian length followed by a Fernet token, so a file can
+    grow one object at a time without rewriting what is already there.
+
+    :param data: The Python object to append.
+    :param filename: Path to the record file, created if missing.
+    :param key: The master encryption key (bytes), the file key is derived from it.
+    :return: Offset of the record in the file.
+    """
+    token = record_fernet(key, filename).encrypt(pickle.dumps(data))
+    with open(filename, 'ab') as f:
+        offset = f.tell()
+        f.write(frame(token))
+        f.flush()
+        os.fsync(f.fileno())
+    return offset
+
+def record_offsets(filename):
     """
-    fernet = Fernet(key)
+    Lists the offset of every complete record in a record file without decrypting anything.
+    A truncated record at the end (e.g. from a crash mid-write) is ignored.
 
+    :param filename: Path to the record file.
+    :return: List of offsets.
+    """
+    offsets = []
+    size = os.path.getsize(filename)
     with open(filename, 'rb') as f:
-        encrypted_data = f.read()  # Read encrypted data
+        offset = 0
+        while offset + 4 <= size:
+            f.seek(offset)
+            length = int.from_bytes(f.read(4), 'big')
+            if offset + 4 + length > size:
+                break
+            offsets.append(offset)
+            offset += 4 + length
+    return offsets
+
+def read_encrypted_record(filename, key, offset):
+    """
+    Decrypts the single record stored at the given offset of a record file.
 
-    decrypted_data = fernet.decrypt(encrypted_data)  # Decrypt the data
-    return pickle.loads(decrypted_data)  # Deserialize into a Python object
+    :param filename: Path to the record file.
+    :param key: The master decryption key (bytes).
+    :param offset: Offset of the record, as returned by append_encrypted_record or record_offsets.
+    :return: The decrypted and deserialized Python object.
+    """
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        length = int.from_bytes(f.read(4), 'big')
+        token = f.read(length)
+    return pickle.loads(record_fernet(key, filename).decrypt(token))
+
+def iter_encrypted_records(filename, key):
+    """
+    Yields every object of a record file in the order they were appended.
+
+    :param filename: Path to the record file.
+    :param key: The master decryption key (bytes).
+    """
+    fernet = record_fernet(key, filename)
+    with open(filename, 'rb') as f:
+        for offset in record_offsets(filename):
+            f.seek(offset)
+            length = int.from_bytes(f.read(4), 'big')
+            yield pickle.loads(fernet.decrypt(f.read(length)))
 
 # Short aliases for convenience
 ep_save = save_encrypted_object
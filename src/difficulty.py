@@ -0,0 +1,175 @@
+"""
+Difficulty retargeting.
+
+A block is valid when its proof-of-work hash, read as a 512-bit integer, is below the target.
+The target moves after every block by a small factor instead of in 16x steps of whole leading
+hex zeros. Solve times are kept in a ring buffer of the last `window` blocks, from which the
+selected algorithm computes the next target:
+
+- lwma: linearly weighted moving average of the window, newer blocks weigh more (default).
+- ema: exponential moving average, only needs the last target and solve time.
+
+Usage: python3 difficulty.py [algorithm ...]
+Replays a few hashrate curves through the simulator and prints the resulting block times:
+the mean, the range of the rolling ROLLING_BLOCKS-block averages and how many of those
+averages stay within 2-5 s. Solve times are exponentially distributed, so even at a
+constant hashrate rolling 20-block averages range about 2-5.7 s; what the window
+controls is how far past that they go when miners come and go.
+"""
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from collections import deque
+
+HASH_SPACE = 1 << 512  # blake2b digests are 64 bytes
+EASIEST_TARGET = 16 ** 126  # two leading hex zeros, the old minimum difficulty
+TARGET_BLOCK_TIME = 3.5  # seconds
+INITIAL_ZEROS = 4  # leading hex zeros a fresh node starts at
+RETARGET_WINDOW = 10  # blocks in the ring buffer, longer windows react too slowly to miners coming and going
+ROLLING_BLOCKS = 20  # blocks per rolling average in the simulator report
+MAX_SOLVE_TIME = 6  # solve times are capped at this many target block times, so one slow block can't crash difficulty
+
+
+def lwma(history, target, target_time, window):
+    """Average target of the window, scaled by the linearly weighted average solve time."""
+    n = len(history)
+    weighted = sum(weight * solve_time for weight, (solve_time, _) in enumerate(history, start=1))
+    average_target = sum(block_target for _, block_target in history) // n
+    k = n * (n + 1) // 2
+    return int(average_target * weighted / (k * target_time))
+
+
+def ema(history, target, target_time, window):
+    """Nudge the last target by 1/window of how far the last solve time was off."""
+    solve_time, _ = history[-1]
+    return int(target * (1 + (solve_time / target_time - 1) / window))
+
+
+ALGORITHMS = {
+    'lwma': lwma,
+    'ema': ema,
+}
+
+
+def zeros_target(zeros):
+    """Target equivalent to requiring `zeros` leading hex zeros."""
+    return min(16 ** (128 - zeros), HASH_SPACE - 1)
+
+
+class Retarget:
+    """
+    Current target of the chain and the solve times it was derived from.
+
+    Mining at a height starts when the first job for it is published and ends when its block
+    is accepted; time spent without a job (empty mempool) doesn't count. Only the start of the
+    height being mined is remembered, so memory stays bounded by the window.
+    """
+
+    def __init__(self, algorithm=None, target_time=None, window=None, target=None):
+        self.algorithm = algorithm or os.getenv("RETARGET_ALGORITHM", 'lwma')
+        if self.algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown retarget algorithm {self.algorithm}, expected one of {', '.join(ALGORITHMS)}")
+        self.target_time = float(target_time or os.getenv("TARGET_BLOCK_TIME") or TARGET_BLOCK_TIME)
+        self.window = int(window or os.getenv("RETARGET_WINDOW") or RETARGET_WINDOW)
+        self.target = target or zeros_target(INITIAL_ZEROS)
+        self.history = deque(maxlen=self.window)  # (solve time, target it was solved at), oldest first
+        self.started = None  # (height, time) mining at the current height started
+
+    @property
+    def difficulty(self):
+        """Expected number of hashes per block."""
+        return HASH_SPACE / self.target
+
+    def zeros(self):
+        """Leading hex zeros that guarantee the target, for miners that only understand zero-prefix difficulty."""
+        return 128 - (self.target.bit_length() - 1) // 4
+
+    def meets(self, block_hash):
+        return int(block_hash, 16) < self.target
+
+    def job_started(self, height, now=None):
+        if self.started is None or self.started[0] != height:
+            self.started = (height, now or time.time())
+
+    def job_stopped(self):
+        """Mining paused, e.g. the mempool ran empty. The next job starts the clock again."""
+        self.started = None
+
+    def block_found(self, height, now=None):
+        """Record the block at `height` and retarget. Returns its solve time, None if its start wasn't seen."""
+        if self.started is None or self.started[0] != height:
+            self.started = None
+            return None
+        solve_time = (now or time.time()) - self.started[1]
+        self.started = None
+        self.record(solve_time)
+        return solve_time
+
+    def record(self, solve_time):
+        solve_time = min(max(solve_time, 0.0), MAX_SOLVE_TIME * self.target_time)
+        self.history.append((solve_time, self.target))
+        target = ALGORITHMS[self.algorithm](self.history, self.target, self.target_time, self.window)
+        self.target = min(max(target, 1), EASIEST_TARGET)
+
+    def state(self):
+        return {'algorithm': self.algorithm, 'target': self.target, 'history': list(self.history)}
+
+    def restore(self, state):
+        """Continue from a saved state, history recorded under another algorithm is still usable."""
+        if not state:
+            return
+        self.target = state['target']
+        self.history.extend(state['history'])
+
+
+def simulate(algorithm, hashrates, target_time=TARGET_BLOCK_TIME, window=RETARGET_WINDOW, seed=1):
+    """
+    Mine one block per entry of `hashrates` (hashes per second) with exponentially distributed
+    solve times. Starts at the target matching the first hashrate. Returns the solve times.
+    """
+    rng = random.Random(seed)
+    retarget = Retarget(algorithm, target_time, window, target=int(HASH_SPACE / (hashrates[0] * target_time)))
+    solve_times = []
+    for hashrate in hashrates:
+        solve_time = rng.expovariate(hashrate / retarget.difficulty)
+        retarget.record(solve_time)
+        solve_times.append(solve_time)
+    return solve_times
+
+
+HASHRATE_CURVES = {
+    'steady': lambda i: 1e6,
+    'step up 10x': lambda i: 1e6 if i < 500 else 1e7,
+    'step down 10x': lambda i: 1e7 if i < 500 else 1e6,
+    'miner hopping': lambda i: 1e6 if (i // 50) % 2 == 0 else 4e6,
+    'slow wave': lambda i: 1e6 * (2.5 + 1.5 * math.sin(i / 80)),
+}
+
+
+def rolling_averages(solve_times, blocks=ROLLING_BLOCKS):
+    """Average solve time of every run of `blocks` consecutive blocks."""
+    total = sum(solve_times[:blocks])
+    averages = [total / blocks]
+    for i in range(blocks, len(solve_times)):
+        total += solve_times[i] - solve_times[i - blocks]
+        averages.append(total / blocks)
+    return averages
+
+
+def report(algorithms, blocks=2000):
+    for algorithm in algorithms:
+        print(f"{algorithm}, target {TARGET_BLOCK_TIME}s, window {RETARGET_WINDOW} blocks")
+        for name, curve in HASHRATE_CURVES.items():
+            solve_times = simulate(algorithm, [curve(i) for i in range(blocks)])
+            averages = rolling_averages(solve_times)
+            steady = sum(1 for average in averages if 2 <= average <= 5) / len(averages)
+            print(f"  {name:>14}: mean {statistics.mean(solve_times):5.2f}s, "
+                  f"rolling {ROLLING_BLOCKS}-block averages {min(averages):5.2f}s to {max(averages):5.2f}s, "
+                  f"{steady:6.1%} within 2-5s")
+
+
+if __name__ == '__main__':
+    report(sys.argv[1:] or list(ALGORITHMS))
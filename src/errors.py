@@ -32,6 +32,10 @@ class RevertedTransactionError(TransactionError):
     """Raised when a transaction is reverted by the blockchain."""
     pass
 
+class MempoolFullError(TransactionError):
+    """Raised when the mempool is full and the transaction can't displace a pending one."""
+    pass
+
 #smartcontract errors
 class SmartContractError(BlockchainError):
     """Base class for smart contract-related errors."""
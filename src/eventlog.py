@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from crypt_util import ep_save, ep_load, append_encrypted_record, iter_encrypted_records
+
+EVENTS_DIR = 'events'
+PAGE_SIZE = 1000  # events per page file
+PAGES_CACHED = 8  # recently read pages kept in memory
+MAX_LOGS = 1000  # events returned by one query, pass `after` to page through more
+MAX_FILTERS = 10000  # installed filters, the least recently created are dropped beyond that
+FILTER_TIMEOUT = 300  # seconds a filter lives without being polled
+
+
+class EventLog:
+    """
+    Events emitted by contracts, queryable by contract address, event name and block range.
+
+    Every event gets a `logIndex` counting all events ever emitted, the block number of the tip it
+    was emitted at, the contract's address and the hash of the transaction that emitted it. Events
+    stay in memory until PAGE_SIZE of them have accumulated, then they are written as an
+    immutable page `<first>-<last>.page`, an ep_save list. The secondary index is a summary per
+    page, with its logIndex range, block range and the (address, event name) pairs in it: a
+    query only reads the pages whose summary can match. Memory holds the events not written yet,
+    the summaries and the last PAGES_CACHED pages read.
+
+    Until their page is written, the events of each transaction are appended to `pending.log`
+    as one encrypted record when the transaction is assigned, and read back from it on startup,
+    so a crash loses no assigned event. Events only become visible to queries and filters once
+    they are assigned, never with a transactionHash of None.
+
+    Without a directory nothing is written and events are dropped instead of paged out.
+    """
+
+    def __init__(self, directory, key):
+        self.directory = directory
+        self.key = key
+        self.lock = threading.RLock()  # events are appended by the writer while readers query
+        self.pending = []  # events not written to a page yet, oldest first
+        self.unassigned = 0  # position in pending of the first event without its transaction
+        self.summaries = []  # one per page, oldest first
+        self.pages = OrderedDict()  # first logIndex -> events, least recently read first
+        self.filters = OrderedDict()  # filter ID -> {'criteria', 'after', 'polled'}, oldest first
+        self.next_filter = 1
+        self.next_index = 0
+        self.pending_log = os.path.join(directory, 'pending.log') if directory else None
+        if directory and os.path.exists(os.path.join(directory, 'index')):
+            self.summaries = ep_load(os.path.join(directory, 'index'), key)
+            if self.summaries:
+                self.next_index = self.summaries[-1]['last'] + 1
+        if self.pending_log and os.path.exists(self.pending_log):
+            for events in iter_encrypted_records(self.pending_log, key):
+                # events already in a page if a crash came between writing it and clearing the log
+                self.pending.extend(event for event in events if event['logIndex'] >= self.next_index)
+            if self.pending:
+                self.next_index = self.pending[-1]['logIndex'] + 1
+            self.unassigned = len(self.pending)
+        self.visible_index = self.next_index  # logIndex of the first event queries can't see yet
+
+    def append(self, event):
+        """Record an event, see SmartContract.make_event. Its transaction is set by the next assign()."""
+        with self.lock:
+            self.pending.append(dict(event, logIndex=self.next_index, transactionHash=None))
+            self.next_index += 1
+            if len(self.pending) - self.unassigned >= PAGE_SIZE * 2:
+                self.assign(None)  # a call emitting this much is runaway, don't hold it all in memory
+
+    def assign(self, tx_hash):
+        """Attribute the events appended since the last assign() to a transaction, persisting them."""
+        with self.lock:
+            events = self.pending[self.unassigned:]
+            for event in events:
+                event['transactionHash'] = tx_hash
+            if events and self.pending_log:
+                os.makedirs(self.directory, exist_ok=True)
+                append_encrypted_record(events, self.pending_log, self.key)
+            self.unassigned = len(self.pending)
+            self.visible_index = self.next_index
+            if len(self.pending) >= PAGE_SIZE:
+                self.write_page()
+
+    def write_page(self):
+        """Move the events with an assigned transaction out of memory into a page."""
+        page, self.pending = self.pending[:self.unassigned], self.pending[self.unassigned:]
+        self.unassigned = 0
+        if not page or not self.directory:
+            return
+        summary = {
+            'first': page[0]['logIndex'],
+            'last': page[-1]['logIndex'],
+            'from_block': min(event['blockNumber'] for event in page),
+            'to_block': max(event['blockNumber'] for event in page),
+            'keys': {(event['address'], event['event']) for event in page},
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        ep_save(page, self.page_path(summary), self.key)
+        self.summaries = self.summaries + [summary]  # replaced, not appended to, queries iterate it without the lock
+        ep_save(self.summaries, os.path.join(self.directory, 'index'), self.key)
+        if os.path.exists(self.pending_log):
+            os.remove(self.pending_log)  # every event in it is in a page now
+
+    def save(self):
+        """Write every event still in memory, called on shutdown."""
+        with self.lock:
+            self.unassigned = len(self.pending)
+            self.write_page()
+
+    def page_path(self, summary):
+        return os.path.join(self.directory, f"{summary['first']}-{summary['last']}.page")
+
+    def page(self, summary):
+        """Events of a page, read from disk without holding the lock if it isn't cached."""
+        with self.lock:
+            events = self.pages.get(summary['first'])
+            if events is not None:
+                self.pages.move_to_end(summary['first'])
+                return events
+        events = ep_load(self.page_path(summary), self.key)
+        with self.lock:
+            self.pages[summary['first']] = events
+            while len(self.pages) > PAGES_CACHED:
+                self.pages.popitem(last=False)
+        return events
+
+    def query(self, addresses=None, names=None, from_block=0, to_block=None, after=-1, limit=MAX_LOGS):
+        """
+        Events in logIndex order emitted by one of `addresses`, named one of `names`, between
+        `from_block` and `to_block` (None: no upper bound), with a logIndex above `after`.
+        None matches any address or name. At most `limit` are returned.
+        """
+        def matches(event):
+            return (event['logIndex'] > after
+                    and from_block <= event['blockNumber'] and (to_block is None or event['blockNumber'] <= to_block)
+                    and (addresses is None or event['address'] in addresses)
+                    and (names is None or event['event'] in names))
+
+        def summary_matches(summary):
+            if summary['last'] <= after or summary['to_block'] < from_block:
+                return False
+            if to_block is not None and summary['from_block'] > to_block:
+                return False
+            return any((addresses is None or address in addresses) and (names is None or name in names)
+                       for address, name in summary['keys'])
+
+        with self.lock:
+            summaries = self.summaries
+            pending = self.pending[:self.unassigned]  # unassigned events are still missing their transaction
+        results = []
+        for summary in summaries:
+            if not summary_matches(summary):
+                continue
+            for event in self.page(summary):
+                if matches(event):
+                    results.append(event)
+                    if len(results) >= limit:
+                        return results
+        for event in pending:
+            if matches(event):
+                results.append(event)
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def new_filter(self, criteria, now=None):
+        """Install a filter over future events, `criteria` are query() arguments. Returns its ID."""
+        now = now or time.time()
+        with self.lock:
+            for filter_id in [filter_id for filter_id, f in self.filters.items() if now - f['polled'] > FILTER_TIMEOUT]:
+                del self.filters[filter_id]
+            while len(self.filters) >= MAX_FILTERS:
+                self.filters.popitem(last=False)
+            filter_id = hex(self.next_filter)
+            self.next_filter += 1
+            self.filters[filter_id] = {'criteria': criteria, 'after': self.visible_index - 1, 'polled': now}
+            return filter_id
+
+    def filter_changes(self, filter_id, now=None):
+        """Events matching a filter since it was last polled, None if there is no such filter."""
+        with self.lock:
+            f = self.filters.get(filter_id)
+            if f is None:
+                return None
+            f['polled'] = now or time.time()
+            criteria, after, visible = f['criteria'], f['after'], self.visible_index - 1
+        results = self.query(**criteria, after=after)
+        with self.lock:
+            if len(results) >= MAX_LOGS:
+                f['after'] = results[-1]['logIndex']
+            else:  # everything up to `visible` was seen, and whatever the query found past it
+                f['after'] = max(visible, results[-1]['logIndex'] if results else visible)
+        return results
+
+    def filter_logs(self, filter_id):
+        """Every event matching a filter, None if there is no such filter."""
+        with self.lock:
+            f = self.filters.get(filter_id)
+            if f is None:
+                return None
+            criteria = f['criteria']
+        return self.query(**criteria)
+
+    def uninstall_filter(self, filter_id):
+        with self.lock:
+            return self.filters.pop(filter_id, None) is not None
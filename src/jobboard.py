@@ -0,0 +1,110 @@
+import json
+import threading
+from collections import OrderedDict
+
+NO_JOB = 'NO_JOB'  # served while the mempool is empty
+POLL_TIMEOUT = 30  # seconds a long-poll waits for a new job before returning the current one
+TEMPLATES_KEPT = 32  # recent jobs that can still be submitted by job ID
+MAX_MINERS = 100000  # miners with an extranonce assigned, the least recently seen lose theirs
+EXTRANONCE_SHIFT = 32  # a miner's nonces are extranonce << 32 up to (extranonce + 1) << 32
+
+
+class JobBoard:
+    """
+    The current mining job, shared by every miner.
+
+    The job is built and serialized once when it changes, not on every request, and each
+    change bumps `version`. Miners pass the version they are working on to wait(), which
+    returns as soon as a newer job is published, e.g. right after a block is accepted.
+    Listeners are called with the new version after every change, the ASGI server uses
+    them to wake its waiters on the event loop.
+
+    Every job gets a job ID and is kept as a template, so a miner only submits the job ID
+    and its nonce. Each miner address is assigned its own extranonce, which fixes the high
+    bits of its nonces: miners search disjoint nonce ranges instead of all racing through
+    the same one.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+        self.key = None  # identifies the job contents, see Blockchain.refresh_mining_job
+        self.job = NO_JOB
+        self.body = json.dumps(NO_JOB).encode()
+        self.listeners = []
+        self.templates = OrderedDict()  # job ID -> job, oldest first
+        self.extranonces = OrderedDict()  # miner address -> extranonce, least recently seen first
+        self.next_extranonce = 1  # 0 is left to legacy miners, which count nonces up from 0
+
+    def publish(self, job, key):
+        """Replace the job, returns False (and notifies nobody) if it is the same job as before."""
+        with self.condition:
+            if key == self.key:
+                return False
+            self.version += 1
+            version = self.version
+            if job != NO_JOB:
+                job = dict(job, job_id=f"{version:x}")
+                self.templates[job['job_id']] = job
+                while len(self.templates) > TEMPLATES_KEPT:
+                    self.templates.popitem(last=False)
+            self.job = job
+            self.key = key
+            self.body = json.dumps(job).encode()
+            self.condition.notify_all()
+        for listener in self.listeners:
+            listener(version)
+        return True
+
+    def current(self):
+        """(version, job, serialized job)"""
+        with self.condition:
+            return self.version, self.job, self.body
+
+    def wait(self, version, timeout=POLL_TIMEOUT):
+        """Block until the job is newer than `version` or the timeout passes, returns current()."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            return self.version, self.job, self.body
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def template(self, job_id):
+        """A recently published job by its ID, None once it has aged out."""
+        with self.condition:
+            return self.templates.get(job_id)
+
+    def extranonce(self, miner):
+        """The extranonce of a miner, assigning the next unused one on first sight."""
+        miner = str(miner).lower()
+        with self.condition:
+            extranonce = self.extranonces.get(miner)
+            if extranonce is None:
+                extranonce = self.next_extranonce
+                self.next_extranonce += 1
+                self.extranonces[miner] = extranonce
+                while len(self.extranonces) > MAX_MINERS:
+                    self.extranonces.popitem(last=False)
+            else:
+                self.extranonces.move_to_end(miner)
+            return extranonce
+
+    def nonce_range(self, miner):
+        """(first, end) of the nonces assigned to a miner, end excluded."""
+        extranonce = self.extranonce(miner)
+        return extranonce << EXTRANONCE_SHIFT, (extranonce + 1) << EXTRANONCE_SHIFT
+
+    def body_for(self, miner, body):
+        """A serialized job with the miner's extranonce and nonce range spliced in, unchanged if there is no job or miner."""
+        if not miner or body == json.dumps(NO_JOB).encode():
+            return body
+        extranonce = self.extranonce(miner)
+        first, end = extranonce << EXTRANONCE_SHIFT, (extranonce + 1) << EXTRANONCE_SHIFT
+        extra = f', "extranonce": {extranonce}, "nonce_start": {first}, "nonce_end": {end}}}'
+        return body[:-1] + extra.encode()
+
+
+def poll_response(version, body):
+    """Long-poll response, with the already serialized job spliced in."""
+    return b'{"version": ' + str(version).encode() + b', "job": ' + body + b'}'
@@ -0,0 +1,138 @@
+import heapq
+import itertools
+from errors import *
+
+MAX_MEMPOOL_SIZE = 50000  # default cap on pending transactions
+
+
+def transaction_fee(tx):
+    """Gas a transaction pays when mined, zero value transactions pay the flat base fee."""
+    if tx.amount == 0:
+        return 0.003469
+    return 0.003469 * tx.amount
+
+
+class Mempool:
+    """
+    Pool of unconfirmed transactions.
+
+    Transactions are indexed by hash and by (sender, nonce), so inclusion in a block,
+    cancellation and replacement are dictionary operations. Mining order is highest fee
+    first, then earliest arrival. Two lazily cleaned heaps keep the best and the worst
+    transaction reachable without sorting the pool: stale heap entries are skipped when
+    they surface and the heaps are rebuilt once they are mostly stale.
+    """
+
+    def __init__(self, max_size=MAX_MEMPOOL_SIZE):
+        self.max_size = int(max_size)
+        self.transactions = {}  # tx hash -> tx, in arrival order
+        self.sequence = {}  # tx hash -> arrival sequence number
+        self.by_nonce = {}  # (sender, nonce) -> {tx hash: tx}
+        self.sender_counts = {}  # sender -> number of pending transactions
+        self.best_heap = []  # (-fee, sequence, tx hash), pops the next tx to mine
+        self.worst_heap = []  # (fee, -sequence, tx hash), pops the next tx to evict
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def __contains__(self, tx_hash):
+        return tx_hash in self.transactions
+
+    def __iter__(self):
+        return iter(list(self.transactions.values()))
+
+    def get(self, tx_hash):
+        return self.transactions.get(tx_hash)
+
+    def add(self, tx):
+        """Add a transaction, evicting the cheapest one if the pool is full."""
+        if tx.tx_hash in self.transactions:
+            return tx
+        fee = transaction_fee(tx)
+        if len(self.transactions) >= self.max_size:
+            worst = self.peek_worst()
+            if worst is None or transaction_fee(worst) >= fee:
+                raise MempoolFullError(f"Mempool is full ({self.max_size} pending transactions), fee too low to replace any of them.")
+            self.remove(worst.tx_hash)
+
+        seq = next(self.counter)
+        sender = tx.sender.lower()
+        self.transactions[tx.tx_hash] = tx
+        self.sequence[tx.tx_hash] = seq
+        self.by_nonce.setdefault((sender, int(tx.nonce)), {})[tx.tx_hash] = tx
+        self.sender_counts[sender] = self.sender_counts.get(sender, 0) + 1
+        heapq.heappush(self.best_heap, (-fee, seq, tx.tx_hash))
+        heapq.heappush(self.worst_heap, (fee, -seq, tx.tx_hash))
+        return tx
+
+    def remove(self, tx_hash):
+        """Remove a transaction by hash, returns it or None if it was not pending."""
+        tx = self.transactions.pop(tx_hash, None)
+        if tx is None:
+            return None
+        del self.sequence[tx_hash]
+        sender = tx.sender.lower()
+        key = (sender, int(tx.nonce))
+        same_nonce = self.by_nonce[key]
+        del same_nonce[tx_hash]
+        if not same_nonce:
+            del self.by_nonce[key]
+        self.sender_counts[sender] -= 1
+        if not self.sender_counts[sender]:
+            del self.sender_counts[sender]
+        self.compact_heaps()
+        return tx
+
+    def find(self, sender, nonce):
+        """Return the earliest pending transaction with the given sender and nonce."""
+        same_nonce = self.by_nonce.get((sender.lower(), int(nonce)))
+        if not same_nonce:
+            return None
+        return next(iter(same_nonce.values()))
+
+    def replace(self, tx):
+        """Drop every pending transaction sharing the sender and nonce of tx, then add tx."""
+        same_nonce = self.by_nonce.get((tx.sender.lower(), int(tx.nonce)), {})
+        replaced = [self.remove(tx_hash) for tx_hash in list(same_nonce)]
+        self.add(tx)
+        return replaced
+
+    def pending_count(self, sender):
+        return self.sender_counts.get(sender.lower(), 0)
+
+    def select(self, limit):
+        """Return up to `limit` transactions in mining order, without removing them."""
+        selected = []
+        entries = []
+        while self.best_heap and len(selected) < limit:
+            entry = heapq.heappop(self.best_heap)
+            if not self.is_live(entry[2], entry[1]):
+                continue
+            entries.append(entry)
+            selected.append(self.transactions[entry[2]])
+        for entry in entries:
+            heapq.heappush(self.best_heap, entry)
+        return selected
+
+    def peek_worst(self):
+        """Return the transaction that would be evicted next."""
+        while self.worst_heap:
+            fee, neg_seq, tx_hash = self.worst_heap[0]
+            if self.is_live(tx_hash, -neg_seq):
+                return self.transactions[tx_hash]
+            heapq.heappop(self.worst_heap)
+        return None
+
+    def is_live(self, tx_hash, seq):
+        return self.sequence.get(tx_hash) == seq
+
+    def compact_heaps(self):
+        """Rebuild the heaps once stale entries outnumber live ones."""
+        live = len(self.transactions)
+        if len(self.best_heap) > 2 * live + 64:
+            self.best_heap = [e for e in self.best_heap if self.is_live(e[2], e[1])]
+            heapq.heapify(self.best_heap)
+        if len(self.worst_heap) > 2 * live + 64:
+            self.worst_heap = [e for e in self.worst_heap if self.is_live(e[2], -e[1])]
+            heapq.heapify(self.worst_heap)
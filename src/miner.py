@@ -0,0 +1,165 @@
+"""
+Reference miner for the node.
+
+Usage:
+    python3 miner.py mine <node url> <miner address> [workers]
+    python3 miner.py bench [seconds]
+
+`mine` long-polls the node for jobs (/poll_mining_job), searches the nonce range assigned
+to the miner's address on a pool of worker processes and submits solutions by job ID
+(/submit_job). `bench` reports hashes per second for one worker and for every core, to
+calibrate the difficulty against real hardware.
+
+The proof-of-work hash is blake2b over previous_hash + json.dumps(transactions) + nonce
+(see block.mining_hash). Everything but the nonce is the same for the whole job, so the
+prefix is hashed once and every nonce starts from a copy of that state.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from jobboard import POLL_TIMEOUT
+from difficulty import zeros_target
+
+CHUNK_SIZE = 200000  # nonces per task handed to a worker
+
+
+def prefix_state(previous_hash, transactions):
+    """blake2b state with the constant part of the header already hashed."""
+    state = hashlib.blake2b(digest_size=64)
+    state.update(f"{previous_hash}{json.dumps(transactions)}".encode())
+    return state
+
+
+def job_target(job):
+    """The job's target as 64 big-endian bytes, so digests can be compared to it directly."""
+    if 'target' in job:
+        target = int(job['target'], 16)
+    else:
+        target = zeros_target(job['difficulty'])  # older nodes only send the number of leading zeros
+    return target.to_bytes(64, 'big')
+
+
+def search(previous_hash, transactions, target, start, end):
+    """
+    Try the nonces in [start, end). Returns (nonce, hash) for the first whose digest is below
+    `target` (bytes, see job_target), or (None, None).
+    """
+    base = prefix_state(previous_hash, transactions)
+    for nonce in range(start, end):
+        state = base.copy()
+        state.update(str(nonce).encode())
+        digest = state.digest()
+        if digest < target:
+            return nonce, digest.hex()
+    return None, None
+
+
+class Miner:
+    """Mines the node's current job with a process pool, switching as soon as the node publishes a new one."""
+
+    def __init__(self, url, address, workers=None):
+        self.url = url.rstrip('/')
+        self.address = address
+        self.workers = int(workers or os.cpu_count() or 1)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.job = None
+        self.version = -1
+        self.job_changed = threading.Event()
+
+    def request(self, path, payload=None, timeout=POLL_TIMEOUT + 10):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return json.loads(e.read())
+
+    def poll_jobs(self):
+        """Long-poll the node forever, flagging every new job."""
+        while True:
+            try:
+                reply = self.request(f"/poll_mining_job?miner={self.address}&version={self.version}")
+            except Exception as e:
+                print(f"Polling failed: {e}")
+                time.sleep(5)
+                continue
+            if reply['version'] != self.version:
+                self.job, self.version = reply['job'], reply['version']
+                self.job_changed.set()
+
+    def run(self):
+        threading.Thread(target=self.poll_jobs, daemon=True).start()
+        while True:
+            self.job_changed.wait()
+            self.job_changed.clear()
+            job = self.job
+            if job == 'NO_JOB':
+                continue
+            nonce, block_hash = self.mine(job)
+            if nonce is not None:
+                reply = self.request('/submit_job', {'miner': self.address, 'job_id': job['job_id'], 'nonce': nonce})
+                print(f"Block {job['index']} nonce {nonce}: {reply.get('message')}")
+
+    def mine(self, job):
+        """Search the job's nonce range chunk by chunk, gives up when the node publishes another job."""
+        args = (job['previous_hash'], job['transactions'], job_target(job))
+        next_nonce, end = job.get('nonce_start', 0), job.get('nonce_end', 1 << 32)
+        pending = set()
+        started = time.perf_counter()
+        try:
+            while next_nonce < end or pending:
+                while len(pending) < self.workers * 2 and next_nonce < end:
+                    chunk_end = min(next_nonce + CHUNK_SIZE, end)
+                    pending.add(self.pool.submit(search, *args, next_nonce, chunk_end))
+                    next_nonce = chunk_end
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    nonce, block_hash = future.result()
+                    if nonce is not None:
+                        tried = nonce - job.get('nonce_start', 0)
+                        print(f"Found block {job['index']} after ~{tried} hashes ({tried / (time.perf_counter() - started):.0f} H/s)")
+                        return nonce, block_hash
+                if self.job_changed.is_set():
+                    return None, None
+            return None, None
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def bench(seconds=5):
+    """Hashes per second of search() on one worker and on every core."""
+    previous_hash = hashlib.blake2b(b'bench', digest_size=64).hexdigest()
+    transactions = [{'sender': f"0x{i:040x}", 'recipient': f"0x{i + 1:040x}", 'amount': 10**18, 'nonce': i,
+                     'timestamp': 1700000000.0, 'hash': hashlib.sha256(str(i).encode()).hexdigest()} for i in range(10)]
+    impossible = bytes(64)  # no digest is below zero, so every nonce is tried
+    cores = os.cpu_count() or 1
+    print("blake2b proof of work")
+    for workers in sorted({1, cores}):
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(search, *zip(*[(previous_hash, transactions, impossible, 0, 10)] * workers)))  # warm up
+            hashes = 0
+            started = time.perf_counter()
+            while time.perf_counter() - started < seconds:
+                chunks = [(previous_hash, transactions, impossible, hashes + i * CHUNK_SIZE, hashes + (i + 1) * CHUNK_SIZE)
+                          for i in range(workers)]
+                list(pool.map(search, *zip(*chunks)))
+                hashes += workers * CHUNK_SIZE
+            elapsed = time.perf_counter() - started
+        print(f"  {workers:>3} workers: {hashes / elapsed:12.0f} H/s, {hashes / elapsed / workers:12.0f} H/s per core")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == 'bench':
+        bench(float(sys.argv[2]) if len(sys.argv) > 2 else 5)
+    elif len(sys.argv) >= 4 and sys.argv[1] == 'mine':
+        Miner(sys.argv[2], sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else None).run()
+    else:
+        print(__doc__)
@@ -0,0 +1,68 @@
+import os
+import threading
+from collections import OrderedDict
+
+RESPONSE_CACHE_BYTES = 64 * 1024 * 1024  # serialized JSON kept across all entries
+
+
+class RawJSON(bytes):
+    """Already serialized JSON, spliced into a response as is instead of being encoded again."""
+
+
+class ResponseCache:
+    """
+    LRU cache of serialized JSON for results that never change, like mined blocks and transactions.
+
+    Entries are bounded by their total size in bytes, the least recently used ones are evicted
+    first. Values are built outside the lock, so a slow miss never holds up hits on other keys.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = int(max_bytes or os.getenv("RESPONSE_CACHE_BYTES") or RESPONSE_CACHE_BYTES)
+        self.entries = OrderedDict()  # key -> RawJSON, least recently used first
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, build):
+        """
+        Cached JSON for `key`, calling `build()` for its serialized bytes on a miss.
+        A build that returns None (e.g. nothing found) isn't cached.
+        """
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return body
+            self.misses += 1
+        body = build()
+        if body is None:
+            return None
+        body = RawJSON(body)
+        if len(body) <= self.max_bytes:
+            self.put(key, body)
+        return body
+
+    def put(self, key, body):
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.size, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
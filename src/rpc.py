@@ -0,0 +1,405 @@
+import os
+import json
+import traceback
+from responsecache import RawJSON
+from eventlog import MAX_LOGS
+from utils import hex_to_string, string_to_hex_with_prefix
+
+CHAIN_ID = 6934  # Set your chain ID here
+
+READ_ONLY_METHODS = {
+    'eth_chainId', 'eth_blockNumber', 'eth_getBlockByNumber', 'eth_getBalance', 'eth_getTransactionByHash',
+    'eth_getBlockByHash', 'eth_getCode', 'eth_estimateGas', 'eth_gasPrice', 'eth_getTransactionCount',
+    'net_version', 'eth_getTransactionReceipt', 'eth_getLogs', 'eth_newFilter', 'eth_getFilterChanges',
+    'eth_getFilterLogs', 'eth_uninstallFilter', 'eth_call', 'eth_getProof',
+}
+WRITE_METHODS = {'eth_sendRawTransaction'}  # handled by the state writer, everything else only reads
+
+
+def handle_rpc(blockchain, data, view=None):
+    """Dispatch a single JSON-RPC request, returns the response object. Reads go through `view`, the published one by default."""
+    if view is None:
+        view = blockchain.view()
+    method = data.get('method')
+    if method == 'eth_chainId':
+        return {'jsonrpc': '2.0', 'result': hex(CHAIN_ID), 'id': data.get('id')}
+
+    if method == 'eth_blockNumber':
+        return {'jsonrpc': '2.0', 'result': hex(view.block_number()), 'id': data.get('id')}
+
+    if method == 'eth_getBlockByNumber':
+        return handle_get_block_by_number(data, view)
+
+    if method == 'eth_getBalance':
+        return handle_get_balance(data, view)
+
+    if method == 'eth_getTransactionByHash':
+        return handle_get_transaction_by_hash(data, view)
+
+    if method == 'eth_getBlockByHash':
+        return handle_get_block_by_hash(data, view)
+
+    if method == 'eth_getCode':
+        return {'jsonrpc': '2.0', 'result': blockchain.get_code(data['params'][0]), 'id': data.get('id')}
+
+    if method == 'eth_call':
+        return handle_call(blockchain, data)
+
+    if method == 'eth_getProof':
+        return handle_get_proof(blockchain, data, view)
+
+    if method == 'eth_estimateGas':
+        return handle_estimate_gas(blockchain, data)
+
+    if method == 'eth_gasPrice':
+        return {'jsonrpc': '2.0', 'result': hex(1), 'id': data.get('id')}
+
+    if method == 'eth_getTransactionCount':
+        return handle_get_transaction_count(data, view)
+
+    if method == 'eth_sendRawTransaction':
+        return handle_send_raw_transaction(blockchain, data)
+
+    if method == 'net_version':
+        return {'jsonrpc': '2.0', 'result': hex(CHAIN_ID), 'id': data.get('id')}
+
+    if method == 'eth_getTransactionReceipt':
+        return handle_get_transaction_receipt(data, view)
+
+    if method == 'eth_getLogs':
+        return handle_get_logs(blockchain, data, view)
+
+    if method == 'eth_newFilter':
+        return handle_new_filter(blockchain, data, view)
+
+    if method in ('eth_getFilterChanges', 'eth_getFilterLogs', 'eth_uninstallFilter'):
+        return handle_filter(blockchain, data, view)
+
+    return {'jsonrpc': '2.0', 'error': {'code': -32601, 'message': 'Method not found'}, 'id': data.get('id')}
+
+
+def handle_get_block_by_number(data, view):
+    if 'latest' in data.get('params')[0]:
+        block_number = view.block_number()
+    else:
+        block_number = int(data.get('params')[0], 16)
+    return {'jsonrpc': '2.0', 'result': view.block_json(block_number), 'id': data.get('id')}
+
+
+def handle_get_balance(data, view):
+    address = str(data.get('params')[0])
+    balance = view.get_balance(address)
+    return {'jsonrpc': '2.0', 'result': hex(balance), 'id': data.get('id')}
+
+
+def handle_get_transaction_by_hash(data, view):
+    tx_hash = data.get('params')[0]
+    return {'jsonrpc': '2.0', 'result': view.transaction_json(tx_hash), 'id': data.get('id')}
+
+
+def handle_get_block_by_hash(data, view):
+    block_hash = data.get('params')[0]
+    return {'jsonrpc': '2.0', 'result': view.block_json_by_hash(block_hash), 'id': data.get('id')}
+
+
+def handle_estimate_gas(blockchain, data):
+    call = data['params'][0]
+    gasp = int(call.get('gasPrice', '0x1'), 16)  # in wei
+    amt = int(call.get('value', '0x0'), 16)  # tx value is always sent in wei
+    gasunits = int(amt * 0.003469)
+    call_gas = blockchain.estimate_call_gas(call.get('to'), call.get('data'))  # contract calls are priced by their instructions
+    if call_gas is not None:
+        gasunits = max(gasunits, call_gas)
+    return {'jsonrpc': '2.0', 'result': hex(gasunits * gasp), 'id': data.get('id')}
+
+
+def handle_call(blockchain, data):
+    """
+    Run a contract method read-only. The result is the hex of the JSON response (state, gasUsed and any events or
+    transfers the call would have made), the same encoding as call data. Contract state is always the latest,
+    calls take effect immediately rather than per block, so the block parameter is ignored.
+    """
+    call = data['params'][0]
+    gas = call.get('gas')
+    response = blockchain.call_contract(call.get('to'), call.get('data'), call.get('from'), None if gas is None else quantity(gas))
+    if "error" in response:
+        return rpc_error(data, response["error"], 3)
+    return {'jsonrpc': '2.0', 'result': string_to_hex_with_prefix(json.dumps(response)), 'id': data.get('id')}
+
+
+def handle_get_proof(blockchain, data, view):
+    """
+    Merkle proofs of an address against the state root of a recent block: its balance (accountProof), its
+    contract leaf (contractProof, with codeHash and storageHash) and the requested storage keys of the contract.
+    Each proof can be checked with statetrie.verify_proof.
+    """
+    params = data['params']
+    address = params[0]
+    storage_keys = params[1] if len(params) > 1 and params[1] else []
+    block_number = block_param(params[2] if len(params) > 2 else None, view)
+    proof = blockchain.get_proof(address, storage_keys, block_number)
+    if proof is None:
+        return rpc_error(data, f"State of block {block_number} is not available, only recent blocks can be proven.", -32000)
+    return {'jsonrpc': '2.0', 'result': proof, 'id': data.get('id')}
+
+
+def handle_get_transaction_count(data, view):
+    params = data.get('params')
+    address = params[0]
+    pending = len(params) > 1 and params[1] == 'pending'  # wallets ask for "pending" to get their next nonce
+    count = view.get_transaction_count(address, pending=pending)
+    return {'jsonrpc': '2.0', 'result': hex(count), 'id': data.get('id')}
+
+
+def handle_send_raw_transaction(blockchain, data):
+    raw_transaction = data.get('params')[0]
+    return send_raw_transaction_response(data, blockchain.send_raw_transaction(raw_transaction))
+
+
+def send_raw_transaction_response(data, block_number):
+    """Turn the result of Blockchain.send_raw_transaction into an RPC response."""
+    if not block_number:
+        return {'jsonrpc': '2.0', 'error': {'code': -32603, 'message': 'Internal error: No result was returned by internal function.'}, 'id': data.get('id')}
+    if "contractAddress" in block_number:
+        return {'jsonrpc': '2.0', 'result': block_number["contractAddress"], 'id': data.get('id')}
+    if "data" in block_number:
+        return {'jsonrpc': '2.0', 'result': block_number["data"], 'id': data.get('id')}
+    if "blockNumber" in block_number:
+        return {'jsonrpc': '2.0', 'result': block_number["blockNumber"], 'id': data.get('id')}
+    if "result" in block_number:
+        return {'jsonrpc': '2.0', 'result': block_number["result"], 'id': data.get('id')}
+    if "error" in block_number:
+        return {'jsonrpc': '2.0', 'error': {'code': -32603, 'message': block_number["error"]}, 'id': data.get('id')}
+    else:
+        return {'jsonrpc': '2.0', 'error': {'code': -32603, 'message': 'Internal error: No result was returned by internal function.'}, 'id': data.get('id')}
+
+
+def handle_get_transaction_receipt(data, view):
+    transaction_hash = str(data['params'][0])
+    receipt = view.get_transaction_receipt(transaction_hash)  # None while pending or unknown, wallets expect null
+    return {'jsonrpc': '2.0', 'result': receipt, 'id': data.get('id')}
+
+
+def quantity(value):
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def block_param(value, view):
+    if value is None or value in ('latest', 'pending', 'safe', 'finalized'):
+        return view.block_number()
+    if value == 'earliest':
+        return 0
+    return quantity(value)
+
+
+def log_filter(params, view):
+    """
+    Turn an eth_getLogs/eth_newFilter filter object into EventLog.query() arguments. Events have
+    names rather than topic hashes: topics[0] is an event name, or a list of them, hex encoded
+    (as in logs) or plain. Returns (criteria, after, limit), where `after` (a logIndex) and
+    `limit` are extensions for paging through large results.
+    """
+    addresses = params.get('address')
+    if isinstance(addresses, str):
+        addresses = [addresses]
+    topics = params.get('topics') or [None]
+    names = topics[0]
+    if isinstance(names, str):
+        names = [names]
+    if names is not None:
+        names = {hex_to_string(name) if name.startswith('0x') else name for name in names}
+    if params.get('blockHash'):
+        block = view.get_block_by_hash(params['blockHash'])
+        if block is None:
+            raise ValueError(f"Unknown block {params['blockHash']}")
+        from_block = to_block = block.index
+    else:
+        from_block = block_param(params.get('fromBlock'), view)
+        to_block = params.get('toBlock')
+        to_block = None if to_block in (None, 'latest', 'pending') else block_param(to_block, view)
+    criteria = {
+        'addresses': None if addresses is None else {str(address).lower() for address in addresses},
+        'names': names,
+        'from_block': from_block,
+        'to_block': to_block,
+    }
+    after = -1 if params.get('after') is None else quantity(params['after'])
+    limit = MAX_LOGS if params.get('limit') is None else min(quantity(params['limit']), MAX_LOGS)
+    return criteria, after, limit
+
+
+def log_json(event, view):
+    """An event as an Ethereum log object, with its name and arguments readable as `event` and `args`."""
+    block = view.get_block(event['blockNumber'])
+    return {
+        'address': event['address'],
+        'topics': [string_to_hex_with_prefix(event['event'])],
+        'data': string_to_hex_with_prefix(json.dumps(event['data'])),
+        'blockNumber': hex(event['blockNumber']),
+        'blockHash': block.hash if block is not None else None,
+        'transactionHash': event['transactionHash'],
+        'transactionIndex': hex(0),
+        'logIndex': hex(event['logIndex']),
+        'removed': False,
+        'event': event['event'],
+        'args': event['data'],
+        'timestamp': event['timestamp'],
+    }
+
+
+def handle_get_logs(blockchain, data, view):
+    params = (data.get('params') or [{}])[0]
+    criteria, after, limit = log_filter(params, view)
+    events = blockchain.event_log.query(**criteria, after=after, limit=limit)
+    return {'jsonrpc': '2.0', 'result': [log_json(event, view) for event in events], 'id': data.get('id')}
+
+
+def handle_new_filter(blockchain, data, view):
+    params = (data.get('params') or [{}])[0]
+    criteria, _, _ = log_filter(params, view)
+    return {'jsonrpc': '2.0', 'result': blockchain.event_log.new_filter(criteria), 'id': data.get('id')}
+
+
+def handle_filter(blockchain, data, view):
+    """eth_getFilterChanges, eth_getFilterLogs and eth_uninstallFilter."""
+    filter_id = str(data['params'][0])
+    method = data.get('method')
+    if method == 'eth_uninstallFilter':
+        return {'jsonrpc': '2.0', 'result': blockchain.event_log.uninstall_filter(filter_id), 'id': data.get('id')}
+    if method == 'eth_getFilterChanges':
+        events = blockchain.event_log.filter_changes(filter_id)
+    else:
+        events = blockchain.event_log.filter_logs(filter_id)
+    if events is None:
+        return rpc_error(data, 'Filter not found', -32000)
+    return {'jsonrpc': '2.0', 'result': [log_json(event, view) for event in events], 'id': data.get('id')}
+
+
+def encode_response(response):
+    """
+    Serialize a response or a list of responses to JSON bytes. Results that are already
+    serialized (RawJSON, e.g. from the response cache) are spliced in without re-encoding.
+    """
+    if isinstance(response, list):
+        return b'[' + b', '.join(encode_response(item) for item in response) + b']'
+    result = response.get('result') if isinstance(response, dict) else None
+    if not isinstance(result, RawJSON):
+        return json.dumps(response).encode()
+    rest = {key: value for key, value in response.items() if key != 'result'}
+    return b'{"result": ' + result + b', ' + json.dumps(rest).encode()[1:]
+
+
+def rpc_error(data, message, code=-32603):
+    request_id = data.get('id') if isinstance(data, dict) else None
+    return {'jsonrpc': '2.0', 'error': {'code': code, 'message': message}, 'id': request_id}
+
+
+def handle_single(blockchain, data, view=None):
+    """Handle one request, turning any exception into an error response."""
+    if not isinstance(data, dict):
+        return rpc_error(data, 'Invalid Request', -32600)
+    try:
+        return handle_rpc(blockchain, data, view)
+    except Exception as e:
+        print(traceback.format_exc())
+        return rpc_error(data, f"Error while handling RPC: {str(e)}")
+
+
+def is_write(data):
+    return isinstance(data, dict) and data.get('method') in WRITE_METHODS
+
+
+def handle_reads(blockchain, batch, view):
+    """Answer every read of a batch from one view, returns {position: response}. Never blocks on writers."""
+    return {position: handle_single(blockchain, data, view) for position, data in enumerate(batch) if not is_write(data)}
+
+
+def handle_writes(blockchain, batch):
+    """
+    Apply the writes of a batch in order, returns {position: response}. Raw transactions are verified
+    together before any of them reaches the mempool. Each entry succeeds or fails on its own.
+    """
+    responses = {}
+    raw_entries = []
+    for position, data in enumerate(batch):
+        if not is_write(data):
+            continue
+        if data.get('params'):
+            raw_entries.append(position)
+        else:
+            responses[position] = handle_single(blockchain, data)
+
+    if raw_entries:
+        try:
+            results = blockchain.send_raw_transactions([batch[position]['params'][0] for position in raw_entries])
+            for position, result in zip(raw_entries, results):
+                responses[position] = send_raw_transaction_response(batch[position], result)
+        except Exception as e:
+            print(traceback.format_exc())
+            for position in raw_entries:
+                responses[position] = rpc_error(batch[position], f"Error while handling RPC: {str(e)}")
+    return responses
+
+
+def handle_batch(blockchain, batch):
+    """
+    Handle a JSON-RPC 2.0 batch. Every read in the batch sees the same view of the chain,
+    writes are applied in order after them.
+    """
+    if not batch:
+        return rpc_error({}, 'Invalid Request: empty batch', -32600)
+    responses = handle_reads(blockchain, batch, blockchain.view())
+    if any(is_write(data) for data in batch):
+        responses.update(handle_writes(blockchain, batch))
+    return [responses[position] for position in range(len(batch))]
+
+
+def handle_add_balance(blockchain, data, remote_addr):
+    """Admin faucet, returns (response, HTTP status)."""
+    sender = data.get('sender')
+    recipient = data.get('recipient')
+    amount = data.get('amount')
+    auth = data.get('auth')
+
+    if auth != os.environ.get('ADMIN_AUTH'):
+        return {"message": "Unauthorized", "status": "error"}, 400
+
+    if not sender or not recipient or not amount:
+        return {"message": "Invalid input. Sender, recipient, and amount are required.", "status": "error"}, 400
+
+    print(f"Faucet from {remote_addr}: From {sender} to {recipient}, value: {round(amount/(10**18), 2)}")
+    blockchain.add_transaction(sender, recipient, amount)
+    return {"message": "Transaction recorded and waiting to be mined.", "status": "success"}, 200
+
+
+def handle_submit_mined_block(blockchain, data):
+    """Validate a block submitted by a miner, returns (response, HTTP status)."""
+    miner_address = data.get('miner')
+    miner_nonce = data.get('nonce')
+    block_data = data.get('block_data')
+
+    mined_block = {
+        'index': block_data['index'],
+        'hash': block_data['hash'],
+        'previous_hash': block_data['previous_hash'],
+        'transactions': block_data['transactions'],
+        'nonce': miner_nonce,
+        'difficulty': block_data.get('difficulty'),  # informational, blocks are checked against the node's target
+    }
+
+    result, reason = blockchain.submit_mined_block(mined_block, miner_address)
+    if result:
+        return {'message': 'Block accepted.'}, 200
+    else:
+        return {'message': f'Block rejected: {reason}'}, 400
+
+
+def handle_submit_job(blockchain, data):
+    """Validate a nonce submitted for a job template, returns (response, HTTP status)."""
+    if not data.get('miner') or data.get('job_id') is None or data.get('nonce') is None:
+        return {'message': 'Invalid input. Miner, job_id and nonce are required.'}, 400
+    result, reason = blockchain.submit_job_solution(data['job_id'], data['nonce'], data['miner'])
+    if result:
+        return {'message': 'Block accepted.'}, 200
+    else:
+        return {'message': f'Block rejected: {reason}'}, 400
@@ -0,0 +1,183 @@
+"""
+Optimistic parallel execution of contract calls.
+
+A batch of calls is first executed speculatively and concurrently, each against the contract
+state as it was at the start of the batch. Nothing is written during that phase: every call
+runs through a CallOverlay that buffers its SETs, SEND_TXs and events and records which
+(contract, key) pairs it read. The calls are then committed one by one in batch order. A call
+that read a key written by an earlier call of the batch saw an outdated version of it, so it
+is executed again, now against the committed state, before it is committed. The outcome is
+the same as running the batch one call at a time, and calls to unrelated contracts never
+conflict.
+
+Native methods (xyl_lock, xyl_destroy, ...) change a contract's owner, lock or existence. They
+aren't speculated but run at their turn in the commit phase, and count as a write of the
+contract's META key, which every call reads.
+
+Speculation runs on threads, as calls share the contracts in memory. Threads only run Python
+code in parallel on free-threaded builds. Elsewhere the default is a single worker, and with a
+single worker execute() doesn't speculate at all: it runs the batch one call at a time, the
+loop it replaced, so on a standard CPython build the scheduler is a no-op. EXECUTION_WORKERS
+forces speculation anyway; with the GIL that only adds its overhead, see the 'scheduler'
+benchmark in bench.py.
+"""
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+META = '__meta__'  # owner, lock and existence of a contract
+BALANCE = '__balance__'  # balance of a contract, read by GET_BALANCE and SEND_TX
+
+
+def default_workers():
+    """One worker per core on free-threaded builds, otherwise 1, which turns speculation off."""
+    gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True)()
+    return 1 if gil_enabled else os.cpu_count() or 1
+
+
+class ContractCall:
+    """A contract call taken from a raw transaction, waiting to be executed."""
+
+    __slots__ = ('contract_address', 'data', 'sender', 'gas_limit', 'tx_hash')
+
+    def __init__(self, contract_address, data, sender, gas_limit, tx_hash):
+        self.contract_address = contract_address.lower()
+        self.data = data
+        self.sender = sender
+        self.gas_limit = gas_limit
+        self.tx_hash = tx_hash
+
+
+class CallOverlay:
+    """
+    Stands in for a contract while a call runs speculatively: reads see the contract's state
+    plus the call's own writes, writes and side effects are buffered until the call commits.
+    With `base`, a copy of the state, reads see that instead and the contract is never touched,
+    as for eth_call.
+    """
+
+    def __init__(self, contract, base=None):
+        self.contract = contract
+        self.base = contract.state if base is None else base
+        self.address = contract.address.lower()
+        self.reads = {(self.address, META)}
+        self.writes = {}
+        self.effects = []  # ('send', recipient, amount) and ('event', event) in execution order
+
+    @property
+    def state(self):
+        return {**self.base, **self.writes}
+
+    def get(self, key):
+        if key in self.writes:
+            return self.writes[key]
+        self.reads.add((self.address, key))
+        return self.base.get(key, None)
+
+    def set(self, key, value):
+        self.writes[key] = value
+        return 1
+
+    def balance(self):
+        self.reads.add((self.address, BALANCE))
+        return self.contract.balance()
+
+    def send_funds(self, recipient, amount):
+        self.reads.add((self.address, BALANCE))
+        self.contract.check_funds(amount)
+        self.effects.append(('send', recipient, int(amount)))
+        return 1
+
+    def emit_event(self, event_name, data):
+        self.effects.append(('event', self.contract.make_event(event_name, data)))
+        return 1
+
+    def commit(self, blockchain):
+        """
+        Apply the buffered writes and effects to the contract, returns the (contract, key) pairs written.
+        The contract must be able to pay for all of its sends together, otherwise nothing is applied.
+        """
+        sends = [effect[2] for effect in self.effects if effect[0] == 'send']
+        if sends:
+            self.contract.check_funds(sum(sends))
+        if self.writes:
+            for key in self.writes:
+                blockchain.contract_manager.mark_dirty(self.contract, key=key)
+            self.contract.state.update(self.writes)
+        for effect in self.effects:
+            if effect[0] == 'send':
+                blockchain.add_transaction(self.contract.address, effect[1], effect[2])
+            else:
+                blockchain.event_log.append(effect[1])
+        return {(self.address, key) for key in self.writes}
+
+
+class ExecutionScheduler:
+    """Runs batches of ContractCalls, speculating on a thread pool and committing in order."""
+
+    def __init__(self, blockchain, workers=None):
+        self.blockchain = blockchain
+        self.workers = int(workers or os.getenv("EXECUTION_WORKERS") or default_workers())
+        self.pool = None  # started on the first batch with more than one call
+        self.reexecuted = 0  # calls executed a second time because of a conflict
+
+    def speculable(self, call):
+        """Whether a call can run speculatively: its contract exists and the method isn't native."""
+        contract = self.blockchain.contract_manager.get(call.contract_address)
+        if contract is None:
+            return False
+        try:
+            return contract.parse_call(call.data)[0] not in contract.native_methods
+        except Exception:
+            return False  # malformed, executing it for real only produces its error
+
+    def speculate(self, call):
+        """Execute a call against the current state through an overlay, returns (response, overlay)."""
+        contract = self.blockchain.contract_manager.get(call.contract_address)
+        if contract is None:
+            return None, None
+        overlay = CallOverlay(contract)
+        response = contract.execute(self.blockchain, call.data, call.sender, call.gas_limit, view=overlay)
+        return response, overlay
+
+    def execute(self, calls):
+        """Execute a batch of calls, returns their responses in batch order. Run with the blockchain lock held."""
+        contracts = self.blockchain.contract_manager
+        outcomes = {}  # id of a speculated call -> (response, overlay)
+        if self.workers > 1 and len(calls) > 1:
+            speculative = [call for call in calls if self.speculable(call)]
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='contract-exec')
+            outcomes = dict(zip(map(id, speculative), self.pool.map(self.speculate, speculative)))
+
+        responses = []
+        written = set()  # (contract, key) pairs committed by earlier calls of the batch
+        for call in calls:
+            contract = contracts.get(call.contract_address)
+            if contract is None:
+                responses.append(None)  # unknown or destroyed earlier in the batch
+                continue
+            if id(call) not in outcomes or outcomes[id(call)][1] is None:  # native, or nothing was speculated
+                responses.append(contract.execute(self.blockchain, call.data, call.sender, call.gas_limit))
+                self.blockchain.event_log.assign(call.tx_hash)
+                written.add((call.contract_address, META))
+                continue
+            response, overlay = outcomes[id(call)]
+            if overlay.contract is not contract or not overlay.reads.isdisjoint(written):
+                self.reexecuted += 1
+                response, overlay = self.speculate(call)  # nothing runs concurrently now, this sees every earlier commit
+            if 'error' not in response:  # a failed call changes nothing
+                try:
+                    written |= overlay.commit(self.blockchain)
+                except Exception as e:
+                    response = {"error": f"ExecutionError: {str(e)}", "gasUsed": response.get("gasUsed")}
+            self.blockchain.event_log.assign(call.tx_hash)
+            if 'state' in response:
+                response = dict(response, state=dict(contract.state))  # as of this call, not of its speculation
+            responses.append(response)
+        return responses
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
@@ -1,8 +1,16 @@
 from web3 import Web3
 import json
+import time
+import threading
+from collections import OrderedDict
 from eth_account import Account
 from utils import *
 from errors import *
+from vm import ExecutionContext, compile_method, run, CALL_GAS
+from scheduler import CallOverlay
+
+NATIVE_METHODS = ["xyl_destroy", "xyl_transferOwner", "xyl_getInfo", "xyl_lock", "xyl_unlock"]
+MAX_LOADED_CONTRACTS = 10000  # contracts kept in memory, the least recently used clean ones are dropped beyond that
 
 
 class SmartContract:
@@ -11,7 +19,7 @@ class SmartContract:
         self.state = {}
         self.blockchain = blockchain
         self.locked = False
-        self.native_methods = ["xyl_destroy", "xyl_transferOwner", "xyl_getInfo", "xyl_lock", "xyl_unlock"]
+        self.native_methods = list(NATIVE_METHODS)
         
         # Generate contract address
         deployer_bytes = Web3.to_bytes(hexstr=owner)
@@ -19,7 +27,6 @@ class SmartContract:
         data = deployer_bytes + nonce_bytes
         self.address = str(Web3.keccak(data)[12:].hex())
         
-        self.blockchain.contract_manager.add(self)
         if tdata:
             try:
                 self.methods = json.loads(hex_to_string(tdata))
@@ -27,20 +34,35 @@ class SmartContract:
                 raise InvalidCreationData("Failed to parse contract methods from transaction data.")
         else:
             self.methods = {}
+        self.blockchain.contract_manager.add(self)  # compiles the methods, so only once they are known
+
+    def __getstate__(self):
+        # The blockchain holds locks, open files and db clients, it's reattached on load and on every execute
+        state = self.__dict__.copy()
+        state['blockchain'] = None
+        return state
+
+    def code_record(self):
+        """Everything but the state, as stored by ContractStore."""
+        return {"address": self.address, "owner": self.owner, "locked": getattr(self, "locked", False), "methods": self.methods}
 
     def balance(self) -> int:
         # Get the balance of the contract
         return int(self.blockchain.get_balance(self.address))
 
-    def send_funds(self, recipient, amount):
-        # Send funds to the recipient
+    def check_funds(self, amount):
         if self.balance() < int(amount):
             raise InsufficientBalanceError(f"Insufficient contract balance: having {self.balance()/(10**18)} XYL, trying to send {int(amount)/(10**18)}.")
+
+    def send_funds(self, recipient, amount):
+        # Send funds to the recipient
+        self.check_funds(amount)
         self.blockchain.add_transaction(self.address, recipient, int(amount))
         return 1
 
     def set(self, key, value):
         # Set a value in the contract state
+        self.blockchain.contract_manager.mark_dirty(self, key=key)
         self.state[key] = value
         return 1
 
@@ -71,37 +93,56 @@ class SmartContract:
             raise PermissionDeniedError("Only the owner can transfer ownership.")
         # Update the owner to the new address
         self.owner = new_owner.lower()
+        self.blockchain.contract_manager.mark_dirty(self, code=True)
         return {"result": "Ownership transferred successfully"}
 
     def lock(self, caller):
         if caller.lower() != self.owner:
             raise PermissionDeniedError("Only the owner can lock the contract.")
         self.locked = True
+        self.blockchain.contract_manager.mark_dirty(self, code=True)
         return {"result": "Contract locked successfully"}
 
     def unlock(self, caller):
         if caller.lower() != self.owner:
             raise PermissionDeniedError("Only the owner can unlock the contract.")
         self.locked = False
+        self.blockchain.contract_manager.mark_dirty(self, code=True)
         return {"result": "Contract unlocked successfully"}
 
-    def emit_event(self, event_name, data):
+    def make_event(self, event_name, data):
         if not isinstance(event_name, str) or not isinstance(data, dict):
             raise InvalidExecutionData("Event name must be a string and data must be a dictionary.")
-        event = {
+        return {
+            "address": self.address.lower(),
             "event": event_name,
             "data": data,
+            "blockNumber": self.blockchain.get_last_block().index,  # calls take effect at the tip, they never appear in a block
             "timestamp": time.time()  # Current timestamp
         }
-        self.blockchain.event_log.append(event)
+
+    def emit_event(self, event_name, data):
+        self.blockchain.event_log.append(self.make_event(event_name, data))
         return 1
 
-    def execute(self, new_blockchain, data, caller):
+    def parse_call(self, data):
+        """Split call data, the hex of "<method>|XYL|<json args>", into (method name, args)."""
+        method_name, args = hex_to_string(data).split("|XYL|")
+        return method_name, json.loads(args)
+
+    def execute(self, new_blockchain, data, caller, gas_limit=None, view=None):
+        """
+        Run a method call, `data` is the hex of "<method>|XYL|<json args>". The call halts with an error once
+        it has used `gas_limit` (capped at MAX_CALL_GAS), the gas it used is returned as "gasUsed".
+        Instructions go through `view` if given (see scheduler.CallOverlay), which the caller commits. Otherwise
+        they go through an overlay of their own that is committed only if the call succeeds, so a call that
+        fails or runs out of gas changes nothing.
+        """
         self.blockchain = new_blockchain
         caller = caller.lower()
+        target = view or self
         try:
-            method_name, args = hex_to_string(data).split("|XYL|")
-            args = json.loads(args)
+            method_name, args = self.parse_call(data)
         except (ValueError, json.JSONDecodeError) as e:
             return {"error": f"InvalidExecutionData: Failed to parse execution data: {str(e)}"}
 
@@ -109,13 +150,18 @@ class SmartContract:
             return {"error": "ContractLockedError: Contract is locked, and only the owner can execute methods."}
 
         if method_name in self.native_methods:
+            ctx = ExecutionContext(self, args, caller, gas_limit)
+            if ctx.gas_limit < ctx.gas_used:
+                return {"error": f"GasLimitExceededError: Gas limit {ctx.gas_limit} is below the {CALL_GAS} needed for a call.", "gasUsed": ctx.gas_limit}
+            if view is not None and method_name != "xyl_getInfo":
+                return {"error": f"ReadOnlyError: {method_name} changes the contract, it can only be sent as a transaction."}
             try:
                 if method_name == "xyl_destroy":
                     return self.destroy(caller)
                 elif method_name == "xyl_transferOwner":
                     return self.transfer_ownership(args['newOwner'], caller)
                 elif method_name == "xyl_getInfo":
-                    return self.get_contract_info()
+                    return dict(self.get_contract_info(), state=target.state)
                 elif method_name == "xyl_lock":
                     return self.lock(caller)
                 elif method_name == "xyl_unlock":
@@ -126,97 +172,176 @@ class SmartContract:
         if method_name not in self.methods:
             return {"error": f"MethodNotFoundError: Method '{method_name}' not found in contract."}
 
-        instructions = self.methods[method_name]
-        stack = []
+        program = new_blockchain.contract_manager.program(self, method_name)
+        overlay = view or CallOverlay(self)
+        ctx = ExecutionContext(overlay, args, caller, gas_limit)
 
         try:
-            for instruction in instructions:
-                parts = instruction.split(" ")
-                op = str(parts[0].strip())
-
-                if op == "PUSH_ARG":
-                    arg_name = parts[1]
-                    if arg_name not in args:
-                        raise InvalidExecutionData(f"Missing argument for {instruction}")
-                    stack.append(args[arg_name])
-
-                elif op == "PUSH":
-                    value = parts[1]
-                    stack.append(value)
-
-                elif op == "SET":
-                    key = parts[1]
-                    value = stack.pop()
-                    result = self.set(key, value)
-                    stack.append(result)
-
-                elif op == "GET":
-                    key = parts[1]
-                    stack.append(self.get(key))
-
-                elif op == "SEND_TX":
-                    recipient_var = parts[1]
-                    amount_var = parts[2]
-                    recipient = self.get(recipient_var)
-                    amount = self.get(amount_var)
-                    if recipient is None or amount is None:
-                        raise ExecutionError(f"Undefined variable(s) in SEND_TX: {recipient_var}, {amount_var}")
-                    result = self.send_funds(recipient, amount)
-                    stack.append(result)
-
-                elif op == "GET_BALANCE":
-                    stack.append(self.balance())
-
-                elif op == "EMIT_EVENT":
-                    event_name = self.get(parts[1])
-                    data = self.get(parts[2])
-                    if event_name is None or data is None:
-                        raise ExecutionError(f"Event name '{event_name}' or data '{data}' is not defined.")
-                    result = self.emit_event(event_name, data)
-                    stack.append(result)
-
-                elif op in ["ADD", "SUB", "MUL", "DIV", "MOD", "LT", "GT"]:
-                    b = stack.pop()
-                    a = stack.pop()
-                    if op == "ADD":
-                        stack.append(a + b)
-                    elif op == "SUB":
-                        stack.append(a - b)
-                    elif op == "MUL":
-                        stack.append(a * b)
-                    elif op == "DIV":
-                        if b == 0:
-                            raise ZeroDivisionError("Division by zero")
-                        stack.append(a / b)
-                    elif op == "MOD":
-                        if b == 0:
-                            raise ZeroDivisionError("Division by zero in modulus operation")
-                        stack.append(a % b)
-                    elif op == "LT":
-                        stack.append(1 if a < b else 0)
-                    elif op == "GT":
-                        stack.append(1 if a > b else 0)
-
-                else:
-                    raise ExecutionError(f"Unknown opcode: {op}")
-
-            return {"result": "Execution successful", "state": self.state}
+            run(program, ctx)
+            if view is None:
+                overlay.commit(new_blockchain)
+            return {"result": "Execution successful", "state": target.state, "gasUsed": ctx.gas_used}
+        except GasLimitExceededError as e:
+            return {"error": f"GasLimitExceededError: {str(e)}", "gasUsed": ctx.gas_used}
         except Exception as e:
-            return {"error": f"ExecutionError: {str(e)}"}
+            return {"error": f"ExecutionError: {str(e)}", "gasUsed": ctx.gas_used}
+
+
+def contract_from_records(blockchain, code, state):
+    """Rebuild a contract from its ContractStore records, its address is stored rather than derived again."""
+    contract = SmartContract.__new__(SmartContract)
+    contract.__dict__.update(code)
+    contract.state = state
+    contract.blockchain = blockchain
+    contract.native_methods = list(NATIVE_METHODS)
+    return contract
 
 
 class ContractManager:
-    def __init__(self, blockchain):
-        self.contracts = {}
+    """
+    Contracts by address. With a ContractStore they are loaded on first use and written back
+    by save() only if they changed, otherwise they all live in memory.
+    """
+
+    def __init__(self, blockchain, store=None):
+        self.contracts = OrderedDict()  # address -> loaded contract, least recently used first
         self.blockchain = blockchain
+        self.store = store
+        self.compiled = {}  # contract address -> {method name: program}, see vm.compile_method
+        self.dirty_state = set()  # addresses whose state changed since the last save
+        self.dirty_code = set()  # addresses whose owner, lock or methods changed since the last save
+        self.deleted = set()  # addresses destroyed since the last save
+        self.lock = threading.RLock()  # contracts are looked up from the scheduler's threads too
+
+    def compile(self, contract):
+        self.compiled[contract.address.lower()] = {method_name: compile_method(instructions)
+                                                   for method_name, instructions in contract.methods.items()}
+
+    def invalidate(self, c_address):
+        """Drop the compiled methods of a contract, e.g. when it is redeployed, deleted or unloaded."""
+        self.compiled.pop(c_address.lower(), None)
+
+    def program(self, contract, method_name):
+        """
+        Compiled form of a contract method, compiled on first use if it isn't cached. Only the
+        loaded object of a contract uses the cache: a call still holding one that was since
+        redeployed or unloaded compiles its own program, so it neither runs its successor's
+        methods nor leaves its own behind.
+        """
+        c_address = contract.address.lower()
+        with self.lock:
+            loaded = self.contracts.get(c_address) is contract
+            program = self.compiled.get(c_address, {}).get(method_name) if loaded else None
+        if program is None:
+            program = compile_method(contract.methods[method_name])
+            with self.lock:
+                if loaded and self.contracts.get(c_address) is contract:
+                    self.compiled.setdefault(c_address, {})[method_name] = program
+        return program
+
+    def get(self, c_address):
+        """The contract at an address, loaded from the store if it isn't in memory. None if there is none."""
+        c_address = str(c_address).lower()
+        with self.lock:
+            contract = self.contracts.get(c_address)
+            if contract is not None:
+                self.contracts.move_to_end(c_address)
+                return contract
+            if self.store is None or c_address in self.deleted:
+                return None
+            records = self.store.load(c_address)
+            if records is None:
+                return None
+            contract = contract_from_records(self.blockchain, *records)
+            self.contracts[c_address] = contract
+            self.compile(contract)
+            self.unload_cold()
+            return contract
 
     def add(self, contract):
-        self.contracts[contract.address.lower()] = contract
+        c_address = contract.address.lower()
+        with self.lock:
+            self.invalidate(c_address)
+            self.contracts[c_address] = contract
+            self.compile(contract)
+            self.deleted.discard(c_address)
+            self.mark_dirty(contract, code=True)
+            self.unload_cold()
 
     def delete(self, c_address):
-        if c_address not in self.contracts:
-            return {"error": f"ContractNotFoundError: Contract at address {c_address} does not exist."}
-        del self.contracts[c_address]
+        c_address = c_address.lower()
+        with self.lock:
+            if not self.exists(c_address):
+                return {"error": f"ContractNotFoundError: Contract at address {c_address} does not exist."}
+            self.contracts.pop(c_address, None)
+            self.invalidate(c_address)
+            self.blockchain.world_state.contract_deleted(c_address)
+            self.dirty_state.discard(c_address)
+            self.dirty_code.discard(c_address)
+            if self.store is not None and c_address in self.store:
+                self.deleted.add(c_address)
+
+    def addresses(self):
+        """Addresses of every contract, loaded or not."""
+        addresses = set(self.contracts)
+        if self.store is not None:
+            addresses |= self.store.addresses - self.deleted
+        return addresses
 
     def exists(self, c_address):
-        return c_address in self.contracts
+        c_address = c_address.lower()
+        if c_address in self.contracts:
+            return True
+        return self.store is not None and c_address in self.store and c_address not in self.deleted
+
+    def mark_dirty(self, contract, code=False, key=None):
+        """
+        Flag a contract for the next save(), its code record too if `code`. Called before a state
+        `key` changes, so the state trie can still see the old value.
+
+        A call keeps the contract object it started with, which unload_cold may have dropped by
+        now (another thread loading cold contracts). The object being changed is the newest
+        version of the contract, so it is put back in place of whatever is loaded.
+        """
+        c_address = contract.address.lower()
+        with self.lock:
+            if self.contracts.get(c_address) is not contract and self.exists(c_address):
+                self.contracts[c_address] = contract
+            self.dirty_state.add(c_address)
+            if code:
+                self.dirty_code.add(c_address)
+        if key is not None or code:
+            self.blockchain.world_state.touch_contract(contract, key)
+
+    def unload_cold(self):
+        """Drop the least recently used contracts beyond MAX_LOADED_CONTRACTS, writing each one back first if it changed."""
+        if self.store is None:
+            return
+        while len(self.contracts) > MAX_LOADED_CONTRACTS:
+            c_address = next(iter(self.contracts))
+            self.write_back(c_address)
+            del self.contracts[c_address]
+            self.invalidate(c_address)
+
+    def write_back(self, c_address):
+        """Write the records of one loaded contract that changed since the last save."""
+        contract = self.contracts[c_address]
+        if c_address in self.dirty_code:
+            self.store.write_code(c_address, contract.code_record())
+            self.dirty_code.discard(c_address)
+        if c_address in self.dirty_state:
+            self.store.write_state(c_address, contract.state)
+            self.dirty_state.discard(c_address)
+
+    def save(self):
+        """Write the records of changed contracts and remove those of destroyed ones."""
+        if self.store is None:
+            return
+        with self.lock:
+            for c_address in (self.dirty_code | self.dirty_state) & set(self.contracts):
+                self.write_back(c_address)
+            for c_address in self.deleted:
+                self.store.delete(c_address)
+            self.dirty_code.clear()
+            self.dirty_state.clear()
+            self.deleted.clear()
@@ -0,0 +1,46 @@
+import os
+import traceback
+from crypt_util import ep_save, ep_load
+
+SNAPSHOT_VERSION = 2  # bump whenever the layout below changes, older snapshots are then ignored
+SNAPSHOT_FIELDS = ('height', 'tip_hash', 'balances', 'tx_counts', 'tx_index', 'retarget', 'contract_leaves')
+SNAPSHOT_EVERY = 500  # blocks between snapshots
+
+
+def take_snapshot(blockchain):
+    """Capture the derived state of the chain at its current tip."""
+    tip = blockchain.get_last_block()
+    return {
+        'version': SNAPSHOT_VERSION,
+        'height': tip.index,
+        'tip_hash': tip.hash,
+        'balances': dict(blockchain.balances),
+        'tx_counts': dict(blockchain.tx_counts),
+        'tx_index': dict(blockchain.tx_index),
+        'retarget': blockchain.retarget.state(),
+        'contract_leaves': blockchain.world_state.state(),
+    }
+
+
+def save_snapshot(snapshot, filename, key):
+    """Write a snapshot, ep_save replaces the file atomically so a crash mid-write keeps the previous one."""
+    ep_save(snapshot, filename, key)
+
+
+def load_snapshot(filename, key):
+    """Load a snapshot, returns None if there is none, it has another version or it lacks a field."""
+    if not os.path.exists(filename):
+        return None
+    try:
+        snapshot = ep_load(filename, key)
+    except:
+        print(traceback.format_exc())
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        print("Ignoring state snapshot with an unknown version.")
+        return None
+    missing = [field for field in SNAPSHOT_FIELDS if field not in snapshot]
+    if missing:
+        print(f"Ignoring state snapshot without {', '.join(missing)}.")
+        return None
+    return snapshot
@@ -0,0 +1,184 @@
+"""
+Sparse Merkle trie for authenticated state.
+
+Keys are placed by the bits of sha256(key). A subtree holding a single key collapses into a
+leaf at the top of that subtree and an empty subtree hashes to EMPTY, so the shape only
+depends on the set of keys, never on the order they were written in, and paths are about
+log2(n) deep. Nodes are immutable: set() copies the path it changes and shares the rest, so
+keeping an old root is enough to read and prove the state it had.
+
+    leaf hash   = sha256(0x00 + sha256(key) + sha256(value))
+    branch hash = sha256(0x01 + left hash + right hash)
+
+Values are stored as their JSON text, which is what gets hashed and what proofs carry.
+"""
+import hashlib
+import json
+
+EMPTY = bytes(32)  # hash of an empty subtree
+
+
+def key_hash(key):
+    return hashlib.sha256(key.encode()).digest()
+
+
+def encode_value(value):
+    return json.dumps(value, sort_keys=True)
+
+
+def leaf_hash(key_digest, value_digest):
+    return hashlib.sha256(b'\x00' + key_digest + value_digest).digest()
+
+
+def branch_hash(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def bit(digest, depth):
+    return (digest[depth >> 3] >> (7 - (depth & 7))) & 1
+
+
+class Leaf:
+    __slots__ = ('key', 'value', 'hash')
+
+    def __init__(self, key, value):
+        self.key = key  # sha256 of the key
+        self.value = value  # JSON text of the value
+        self.hash = leaf_hash(key, hashlib.sha256(value.encode()).digest())
+
+
+class Branch:
+    __slots__ = ('left', 'right', 'hash')
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.hash = branch_hash(node_hash(left), node_hash(right))
+
+
+def node_hash(node):
+    return EMPTY if node is None else node.hash
+
+
+def branch(left, right):
+    """Branch over two subtrees, collapsed when one is empty and the other a single leaf."""
+    if left is None and (right is None or isinstance(right, Leaf)):
+        return right
+    if right is None and isinstance(left, Leaf):
+        return left
+    return Branch(left, right)
+
+
+def split(a, b, depth):
+    """Smallest subtree holding two leaves with different keys."""
+    if bit(a.key, depth) != bit(b.key, depth):
+        return Branch(a, b) if bit(a.key, depth) == 0 else Branch(b, a)
+    child = split(a, b, depth + 1)
+    return Branch(child, None) if bit(a.key, depth) == 0 else Branch(None, child)
+
+
+def insert(node, leaf, depth):
+    if node is None:
+        return leaf
+    if isinstance(node, Leaf):
+        return leaf if node.key == leaf.key else split(node, leaf, depth)
+    if bit(leaf.key, depth):
+        return Branch(node.left, insert(node.right, leaf, depth + 1))
+    return Branch(insert(node.left, leaf, depth + 1), node.right)
+
+
+def remove(node, key, depth):
+    if node is None or isinstance(node, Leaf):
+        return None if node is not None and node.key == key else node
+    if bit(key, depth):
+        right = remove(node.right, key, depth + 1)
+        return node if right is node.right else branch(node.left, right)
+    left = remove(node.left, key, depth + 1)
+    return node if left is node.left else branch(left, node.right)
+
+
+def build(leaves, depth):
+    """Trie over leaves sorted by key, in one pass instead of one insert per leaf."""
+    if not leaves:
+        return None
+    if len(leaves) == 1:
+        return leaves[0]
+    middle = 0
+    while middle < len(leaves) and bit(leaves[middle].key, depth) == 0:
+        middle += 1
+    return Branch(build(leaves[:middle], depth + 1), build(leaves[middle:], depth + 1))
+
+
+class StateTrie:
+    """A sparse Merkle trie, see the module docstring. `root` is the root node, None when empty."""
+
+    def __init__(self, root=None):
+        self.root = root
+
+    def root_hash(self):
+        return node_hash(self.root).hex()
+
+    def set(self, key, value):
+        """Set a key, None deletes it."""
+        if value is None:
+            self.root = remove(self.root, key_hash(key), 0)
+        else:
+            self.root = insert(self.root, Leaf(key_hash(key), encode_value(value)), 0)
+
+    def get(self, key, root=None):
+        """JSON text of a key's value, None if it isn't set."""
+        leaf, _ = self.walk(key_hash(key), self.root if root is None else root)
+        return leaf.value if leaf is not None and leaf.key == key_hash(key) else None
+
+    def walk(self, digest, node):
+        """(leaf or None where the path of `digest` ends, sibling hashes from the root down)"""
+        siblings = []
+        depth = 0
+        while isinstance(node, Branch):
+            if bit(digest, depth):
+                siblings.append(node_hash(node.left))
+                node = node.right
+            else:
+                siblings.append(node_hash(node.right))
+                node = node.left
+            depth += 1
+        return node, siblings
+
+    def prove(self, key, root=None):
+        """
+        Proof that `key` has its value, or is unset, under the root `root` (the current one by default).
+        A proof of absence ends at an empty subtree or at the leaf of another key; see verify_proof.
+        """
+        digest = key_hash(key)
+        leaf, siblings = self.walk(digest, self.root if root is None else root)
+        proof = {'key': key, 'value': None, 'siblings': [sibling.hex() for sibling in siblings]}
+        if leaf is not None and leaf.key == digest:
+            proof['value'] = leaf.value
+        elif leaf is not None:
+            proof['leaf'] = {'keyHash': leaf.key.hex(), 'valueHash': hashlib.sha256(leaf.value.encode()).hexdigest()}
+        return proof
+
+
+def build_trie(items):
+    """StateTrie holding the (key, value) pairs of `items`, values of None are skipped."""
+    leaves = sorted((Leaf(key_hash(key), encode_value(value)) for key, value in items if value is not None),
+                    key=lambda leaf: leaf.key)
+    return StateTrie(build(leaves, 0))
+
+
+def verify_proof(root_hash, proof):
+    """Check a proof from StateTrie.prove against a root hash (hex). True if it shows proof['value'] for proof['key']."""
+    digest = key_hash(proof['key'])
+    siblings = [bytes.fromhex(sibling) for sibling in proof['siblings']]
+    if proof['value'] is not None:
+        node = leaf_hash(digest, hashlib.sha256(proof['value'].encode()).digest())
+    elif proof.get('leaf'):
+        other = bytes.fromhex(proof['leaf']['keyHash'])
+        if other == digest or any(bit(other, depth) != bit(digest, depth) for depth in range(len(siblings))):
+            return False  # not a different key on the same path
+        node = leaf_hash(other, bytes.fromhex(proof['leaf']['valueHash']))
+    else:
+        node = EMPTY
+    for depth in reversed(range(len(siblings))):
+        node = branch_hash(siblings[depth], node) if bit(digest, depth) else branch_hash(node, siblings[depth])
+    return node.hex() == root_hash
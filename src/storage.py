@@ -0,0 +1,86 @@
+import copy
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+from pymongo.mongo_client import MongoClient
+
+
+class MongoStorage:
+    """Persists chain, balances and contracts in MongoDB."""
+
+    def __init__(self, url, db_name='XYL_TestNet'):
+        self.client = MongoClient(url)
+        self.db = self.client[db_name]
+
+    def find_blocks(self, after=None):
+        """Blocks in index order, only those with an index above `after` if given."""
+        query = {} if after is None else {"index": {"$gt": after}}
+        return self.db['chain'].find(query).sort("index", 1)
+
+    def find_balances(self):
+        return self.db['balances'].find().sort("address", 1)
+
+    def insert_block(self, block_doc, session=None):
+        self.db['chain'].insert_one(block_doc, session=session)
+
+    def insert_contract(self, contract_doc):
+        self.db['contracts'].insert_one(contract_doc)
+
+    def write_balances(self, balances, session=None):
+        """Upsert several balances in one bulk_write round trip."""
+        if not balances:
+            return
+        ops = [
+            UpdateOne({"address": address}, {"$set": {"balance": str(balance)}}, upsert=True)
+            for address, balance in balances.items()
+        ]
+        self.db['balances'].bulk_write(ops, ordered=False, session=session)
+
+    def commit_block(self, block_doc, balances):
+        """Write a block and the balances it changed, atomically when the deployment supports transactions."""
+        def write(session):
+            self.insert_block(block_doc, session=session)
+            self.write_balances(balances, session=session)
+
+        try:
+            with self.client.start_session() as session:
+                session.with_transaction(write)
+        except OperationFailure as e:
+            if e.code != 20:  # IllegalOperation: standalone servers have no transactions
+                raise
+            write(None)
+
+
+class MemoryStorage:
+    """In-process stand-in for MongoStorage, for tests and offline runs."""
+
+    def __init__(self):
+        self.blocks = []
+        self.balances = {}
+        self.contracts = []
+        self.writes = 0  # number of round trips a real backend would have made
+
+    def find_blocks(self, after=None):
+        blocks = [doc for doc in self.blocks if after is None or doc["index"] > after]
+        return [copy.deepcopy(doc) for doc in sorted(blocks, key=lambda doc: doc["index"])]
+
+    def find_balances(self):
+        return [{"address": address, "balance": balance} for address, balance in sorted(self.balances.items())]
+
+    def insert_block(self, block_doc, session=None):
+        self.blocks.append(copy.deepcopy(block_doc))
+        self.writes += 1
+
+    def insert_contract(self, contract_doc):
+        self.contracts.append(dict(contract_doc))
+        self.writes += 1
+
+    def write_balances(self, balances, session=None):
+        if not balances:
+            return
+        for address, balance in balances.items():
+            self.balances[address] = str(balance)
+        self.writes += 1
+
+    def commit_block(self, block_doc, balances):
+        self.insert_block(block_doc)
+        self.write_balances(balances)
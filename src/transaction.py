@@ -5,7 +5,9 @@ import traceback
 from errors import *
 
 class Transaction:
-    def __init__(self, sender, recipient, amount, nonce, timestamp=None):
+    __slots__ = ('sender', 'recipient', 'amount', 'nonce', 'timestamp', '_tx_hash')
+
+    def __init__(self, sender, recipient, amount, nonce, timestamp=None, tx_hash=None):
         """Initializes a transaction.
 
         :param sender: Wallet address of the sender.
@@ -13,6 +15,7 @@ class Transaction:
         :param amount: Amount of XYL tokens being transferred.
         :param nonce: A unique identifier for this transaction. Used to prevent double-spending and for transaction replacement.
         :param timestamp: Optional timestamp; if None, current time is used.
+        :param tx_hash: Optional known hash; if None, it is computed on first access.
         """
         self.sender = sender
         self.recipient = recipient
@@ -23,7 +26,33 @@ class Transaction:
 
         self.nonce = int(nonce)  # Unique nonce for the transaction
         self.timestamp = timestamp or time.time()  # Default to current time
-        self.tx_hash = self.compute_hash()  # Unique transaction hash for integrity
+        self._tx_hash = tx_hash  # Unique transaction hash for integrity, computed lazily
+
+    @property
+    def tx_hash(self):
+        if self._tx_hash is None:
+            self._tx_hash = self.compute_hash()
+        return self._tx_hash
+
+    @tx_hash.setter
+    def tx_hash(self, value):
+        self._tx_hash = value
+
+    def __getstate__(self):
+        """Pickle the plain field values, the same layout older __dict__ based transactions used."""
+        return {
+            'sender': self.sender,
+            'recipient': self.recipient,
+            'amount': self.amount,
+            'nonce': self.nonce,
+            'timestamp': self.timestamp,
+            'tx_hash': self.tx_hash
+        }
+
+    def __setstate__(self, state):
+        self._tx_hash = None
+        for name, value in state.items():
+            setattr(self, name, value)
 
     def compute_hash(self):
         """Computes the SHA-256 hash of the transaction details.
@@ -77,7 +106,5 @@ def tx_from_json(data):
     nonce = data.get('nonce') or 0
     timestamp = data['timestamp']
 
-    # Recreate the transaction
-    tx = Transaction(sender, recipient, amount, nonce, timestamp)
-    tx.tx_hash = data['hash']  # Set the hash explicitly for consistency
-    return tx
+    # Recreate the transaction with its known hash, so it isn't recomputed
+    return Transaction(sender, recipient, amount, nonce, timestamp, tx_hash=data['hash'])
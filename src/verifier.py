@@ -0,0 +1,46 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from tx_decode import tx_decode
+
+
+def decode_or_error(raw_transaction):
+    """Decode a raw transaction and recover its sender, returns (tx_dict, None) or (None, error message)."""
+    try:
+        return tx_decode(raw_transaction), None
+    except Exception as e:
+        return None, f"Invalid transaction: {type(e).__name__}: {e}"
+
+
+class TxVerifier:
+    """
+    Decodes raw transactions and recovers their senders on a pool of worker processes.
+
+    ECDSA recovery is pure CPU work that holds the GIL, so batches are spread across processes
+    instead of threads. With one worker everything runs inline. Workers are started from a
+    fork server (spawned where there is none), never forked from the server process itself:
+    a fork would copy locks held by its other threads and could deadlock the workers.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = int(workers or os.getenv("VERIFY_WORKERS") or os.cpu_count() or 1)
+        self.pool = None  # started on the first batch
+
+    def verify(self, raw_transaction):
+        return decode_or_error(raw_transaction)
+
+    def verify_batch(self, raw_transactions):
+        """Decode a batch, results come back in the same order as the input."""
+        raw_transactions = list(raw_transactions)
+        if self.workers <= 1 or len(raw_transactions) < 2:
+            return [decode_or_error(raw) for raw in raw_transactions]
+        if self.pool is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(start_method))
+        chunksize = max(1, len(raw_transactions) // (self.workers * 4))
+        return list(self.pool.map(decode_or_error, raw_transactions, chunksize=chunksize))
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
@@ -0,0 +1,269 @@
+"""
+Compiler and interpreter for contract methods.
+
+A method is a list of instruction strings such as "PUSH_ARG amount" or "SET total". They are
+compiled once into a tuple of (handler, operand, operand) entries, so running a method is a
+loop of direct calls: no string splitting and no opcode comparisons per instruction.
+
+Every opcode has a gas cost. Methods have no jumps, so the cost of running a whole method is
+known at compile time: a call whose gas limit covers it runs without any per-instruction
+accounting, otherwise only the instructions the limit pays for run before it halts with
+GasLimitExceededError.
+
+Arithmetic also pays for the size of its values: WORD_GAS for every 32-byte word of its
+operands (or of its result, when that is bigger) beyond the first, and no value may grow past
+MAX_VALUE_WORDS. Sizes are checked before anything is computed, so a call can't turn a few
+instructions into gigabytes of string or integer. ADD works on two numbers, two strings or two
+lists, the other arithmetic only on numbers. One-word integers, what nearly every method works
+on, owe no size gas and skip the size checks altogether.
+"""
+import bisect
+import os
+from errors import *
+
+CALL_GAS = 21  # charged for every call, native methods included
+MAX_CALL_GAS = 1000000  # upper bound on the gas limit of a call, whatever the transaction offers
+WORD_GAS = 1  # per 32-byte word of an arithmetic value beyond the first
+MAX_VALUE_WORDS = 1024  # largest value arithmetic may produce: 32 KiB of string, 262144-bit integers
+WORD = 1 << 256  # integers strictly between -WORD and WORD are one word, they take the fast paths below
+
+
+class ExecutionContext:
+    """State of one method call: the contract it runs on, its arguments and its stack."""
+
+    __slots__ = ('contract', 'args', 'caller', 'stack', 'gas_limit', 'gas_used', 'size_gas')
+
+    def __init__(self, contract, args, caller=None, gas_limit=None):
+        self.contract = contract
+        self.args = args
+        self.caller = caller
+        self.stack = []
+        self.gas_limit = max_call_gas() if gas_limit is None else min(int(gas_limit), max_call_gas())
+        self.gas_used = CALL_GAS
+        self.size_gas = 0  # charged by arithmetic for the size of its values, see charge_words
+
+
+def max_call_gas():
+    return int(os.getenv("MAX_CALL_GAS") or MAX_CALL_GAS)
+
+
+def value_words(value):
+    """Size of a stack value in 32-byte words, list and dict entries count as one word each."""
+    if isinstance(value, int):
+        return max(1, (value.bit_length() + 255) // 256)
+    if isinstance(value, str):
+        return max(1, (len(value) + 31) // 32)
+    if isinstance(value, (list, dict)):
+        return max(1, len(value))
+    return 1
+
+
+def charge_words(ctx, words, op):
+    """Charge for arithmetic on `words` words, before it runs. While a program runs ctx.gas_used holds its whole static cost."""
+    if words > MAX_VALUE_WORDS:
+        raise ExecutionError(f"{op} on {words} words of values, the limit is {MAX_VALUE_WORDS}")
+    ctx.size_gas += (words - 1) * WORD_GAS
+    if ctx.gas_used + ctx.size_gas > ctx.gas_limit:
+        raise GasLimitExceededError(f"Out of gas in {op} on {words} words of values, gas limit {ctx.gas_limit}")
+
+
+def numbers(op, a, b):
+    if not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
+        raise ExecutionError(f"{op} needs two numbers, got {type(a).__name__} and {type(b).__name__}")
+
+
+def op_push_arg(ctx, arg_name, instruction):
+    if arg_name not in ctx.args:
+        raise InvalidExecutionData(f"Missing argument for {instruction}")
+    ctx.stack.append(ctx.args[arg_name])
+
+
+def op_push(ctx, value, _):
+    ctx.stack.append(value)
+
+
+def op_set(ctx, key, _):
+    value = ctx.stack.pop()
+    ctx.stack.append(ctx.contract.set(key, value))
+
+
+def op_get(ctx, key, _):
+    ctx.stack.append(ctx.contract.get(key))
+
+
+def op_send_tx(ctx, recipient_var, amount_var):
+    recipient = ctx.contract.get(recipient_var)
+    amount = ctx.contract.get(amount_var)
+    if recipient is None or amount is None:
+        raise ExecutionError(f"Undefined variable(s) in SEND_TX: {recipient_var}, {amount_var}")
+    ctx.stack.append(ctx.contract.send_funds(recipient, amount))
+
+
+def op_get_balance(ctx, _, __):
+    ctx.stack.append(ctx.contract.balance())
+
+
+def op_emit_event(ctx, name_var, data_var):
+    event_name = ctx.contract.get(name_var)
+    data = ctx.contract.get(data_var)
+    if event_name is None or data is None:
+        raise ExecutionError(f"Event name '{event_name}' or data '{data}' is not defined.")
+    ctx.stack.append(ctx.contract.emit_event(event_name, data))
+
+
+def op_add(ctx, _, __):
+    b = ctx.stack.pop()
+    a = ctx.stack.pop()
+    if type(a) is int and type(b) is int and -WORD < a < WORD and -WORD < b < WORD:
+        pass  # the common case, one-word integers owe no size gas
+    elif isinstance(a, (str, list)) and type(a) is type(b):
+        charge_words(ctx, value_words(a) + value_words(b), "ADD")
+    else:
+        numbers("ADD", a, b)
+        charge_words(ctx, max(value_words(a), value_words(b)), "ADD")
+    ctx.stack.append(a + b)
+
+
+def op_sub(ctx, _, __):
+    b = ctx.stack.pop()
+    a = ctx.stack.pop()
+    if not (type(a) is int and type(b) is int and -WORD < a < WORD and -WORD < b < WORD):
+        numbers("SUB", a, b)
+        charge_words(ctx, max(value_words(a), value_words(b)), "SUB")
+    ctx.stack.append(a - b)
+
+
+def op_mul(ctx, _, __):
+    b = ctx.stack.pop()
+    a = ctx.stack.pop()
+    if not (type(a) is int and type(b) is int and -WORD < a < WORD and -WORD < b < WORD):
+        numbers("MUL", a, b)
+        charge_words(ctx, value_words(a) + value_words(b) - 1, "MUL")  # the product's size
+    ctx.stack.append(a * b)
+
+
+def op_div(ctx, _, __):
+    b = ctx.stack.pop()
+    a = ctx.stack.pop()
+    numbers("DIV", a, b)
+    charge_words(ctx, max(value_words(a), value_words(b)), "DIV")
+    if b == 0:
+        raise ZeroDivisionError("Division by zero")
+    ctx.stack.append(a / b)
+
+
+def op_mod(ctx, _, __):
+    b = ctx.stack.pop()
+    a = ctx.stack.pop()
+    numbers("MOD", a, b)
+    charge_words(ctx, max(value_words(a), value_words(b)), "MOD")
+    if b == 0:
+        raise ZeroDivisionError("Division by zero in modulus operation")
+    ctx.stack.append(a % b)
+
+
+def op_lt(ctx, _, __):
+    b = ctx.stack.pop()
+    a = ctx.stack.pop()
+    if not (type(a) is int and -WORD < a < WORD or type(b) is int and -WORD < b < WORD):
+        charge_words(ctx, min(value_words(a), value_words(b)), "LT")  # comparisons stop at the shorter value
+    ctx.stack.append(1 if a < b else 0)
+
+
+def op_gt(ctx, _, __):
+    b = ctx.stack.pop()
+    a = ctx.stack.pop()
+    if not (type(a) is int and -WORD < a < WORD or type(b) is int and -WORD < b < WORD):
+        charge_words(ctx, min(value_words(a), value_words(b)), "GT")
+    ctx.stack.append(1 if a > b else 0)
+
+
+def op_fail(ctx, error, _):
+    """Stands in for an instruction that didn't compile, it fails when reached like it always has."""
+    raise error
+
+
+# opcode -> (handler, operands read from the instruction, gas), an operand of -1 is the instruction itself
+OPCODES = {
+    'PUSH_ARG': (op_push_arg, (1, -1), 3),
+    'PUSH': (op_push, (1,), 3),
+    'SET': (op_set, (1,), 20),
+    'GET': (op_get, (1,), 5),
+    'SEND_TX': (op_send_tx, (1, 2), 200),
+    'GET_BALANCE': (op_get_balance, (), 10),
+    'EMIT_EVENT': (op_emit_event, (1, 2), 50),
+    'ADD': (op_add, (), 3),
+    'SUB': (op_sub, (), 3),
+    'MUL': (op_mul, (), 5),
+    'DIV': (op_div, (), 5),
+    'MOD': (op_mod, (), 5),
+    'LT': (op_lt, (), 3),
+    'GT': (op_gt, (), 3),
+}
+FAIL_GAS = 1  # an instruction that didn't compile
+
+
+class Program:
+    """A compiled method: its instructions and the gas used up to and including each of them."""
+
+    __slots__ = ('instructions', 'cumulative_gas', 'gas')
+
+    def __init__(self, compiled):
+        self.instructions = tuple((handler, a, b) for handler, a, b, _ in compiled)
+        self.cumulative_gas = []
+        total = 0
+        for _, _, _, gas in compiled:
+            total += gas
+            self.cumulative_gas.append(total)
+        self.gas = total
+
+    def __len__(self):
+        return len(self.instructions)
+
+
+def compile_instruction(instruction):
+    parts = instruction.split(" ")
+    op = str(parts[0].strip())
+    if op not in OPCODES:
+        return op_fail, ExecutionError(f"Unknown opcode: {op}"), None, FAIL_GAS
+    handler, positions, gas = OPCODES[op]
+    try:
+        operands = [instruction if position == -1 else parts[position] for position in positions]
+    except IndexError as e:
+        return op_fail, e, None, FAIL_GAS
+    operands += [None] * (2 - len(operands))
+    return handler, operands[0], operands[1], gas
+
+
+def compile_method(instructions):
+    """Compile a method's instruction strings into a Program for run()."""
+    return Program([compile_instruction(instruction) for instruction in instructions])
+
+
+def run(program, ctx):
+    """
+    Run a compiled program, charging its gas to the context. Exceptions from instructions
+    propagate to the caller with ctx.gas_used covering the instruction that raised.
+    """
+    base = ctx.gas_used
+    budget = ctx.gas_limit - base - ctx.size_gas
+    if program.gas <= budget:
+        instructions = program.instructions
+    else:
+        instructions = program.instructions[:bisect.bisect_right(program.cumulative_gas, budget)]
+    ctx.gas_used = base + program.gas  # what charge_words checks size gas against
+    position = 0
+    try:
+        for position, (handler, a, b) in enumerate(instructions):
+            handler(ctx, a, b)
+    except GasLimitExceededError:
+        ctx.gas_used = ctx.gas_limit
+        raise
+    except Exception:
+        ctx.gas_used = base + program.cumulative_gas[position] + ctx.size_gas
+        raise
+    if len(instructions) < len(program) or budget < 0:
+        ctx.gas_used = ctx.gas_limit
+        raise GasLimitExceededError(f"Out of gas after {len(instructions)} of {len(program)} instructions, gas limit {ctx.gas_limit}")
+    ctx.gas_used = base + program.gas + ctx.size_gas
+    return ctx
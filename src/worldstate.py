@@ -0,0 +1,205 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from statetrie import StateTrie, build_trie, encode_value
+
+STATE_ROOTS_KEPT = 128  # recent blocks whose state can still be proven
+STORAGE_TRIES_KEPT = 1000  # contract storage tries kept in memory, rebuilt from the contract when needed
+
+
+def balance_key(address):
+    return f"balance:{address}"
+
+
+def contract_key(address):
+    return f"contract:{address}"
+
+
+def code_hash(contract):
+    code = {"owner": contract.owner, "locked": getattr(contract, "locked", False), "methods": contract.methods}
+    return hashlib.sha256(json.dumps(code, sort_keys=True).encode()).hexdigest()
+
+
+class WorldState:
+    """
+    Authenticated state of the chain, committed to by the state root of every block.
+
+    The account trie holds a `balance:<address>` leaf per balance and a `contract:<address>`
+    leaf per contract, whose value is the contract's code hash and the root of its storage
+    trie, one leaf per key of its state. Changes are collected as they happen and applied when
+    a block is sealed, so a block costs O(log n) per balance or storage key it touched.
+
+    Roots of the last STATE_ROOTS_KEPT blocks are kept for proofs. Storage tries are only built
+    for contracts in use; when a contract is changed after a seal, the root its trie had is
+    stashed under that block so older blocks stay provable.
+    """
+
+    def __init__(self):
+        self.accounts = StateTrie()
+        self.storage = OrderedDict()  # contract address -> storage trie, least recently used first
+        self.contract_values = {}  # contract address -> value of its account leaf, for snapshots
+        self.touched_balances = set()
+        self.touched_contracts = {}  # contract address -> storage keys changed since the last seal, None if deleted
+        self.roots = OrderedDict()  # block index -> account trie root
+        self.storage_before = OrderedDict()  # block index -> {contract address: storage trie root at that block}
+        self.sealed = None  # index of the last sealed block
+        self.lock = threading.RLock()  # proofs are served from reader threads
+
+    def touch_balance(self, address):
+        self.touched_balances.add(address)
+
+    def touch_contract(self, contract, key=None):
+        """Called before a contract's state (key) or code (no key) changes."""
+        address = contract.address.lower()
+        with self.lock:
+            keys = self.touched_contracts.get(address)
+            if keys is None:
+                self.storage_trie(contract)  # the trie must hold the state from before the change
+                keys = self.touched_contracts[address] = set()
+            if key is not None:
+                keys.add(key)
+
+    def contract_deleted(self, address):
+        with self.lock:
+            self.touched_contracts[address.lower()] = None
+
+    def storage_trie(self, contract):
+        """Storage trie of a contract, built from its state if it isn't in memory."""
+        address = contract.address.lower()
+        with self.lock:
+            trie = self.storage.get(address)
+            if trie is not None:
+                self.storage.move_to_end(address)
+                return trie
+            trie = self.storage[address] = build_trie(contract.state.items())
+            if address not in self.touched_contracts and self.contract_values.get(address) != self.contract_value(contract, trie):
+                self.touched_contracts[address] = set()  # state saved apart from the last snapshot, recommit it
+            for cold in [cold for cold in self.storage if cold not in self.touched_contracts]:
+                if len(self.storage) <= STORAGE_TRIES_KEPT:
+                    break
+                del self.storage[cold]
+            return trie
+
+    def contract_value(self, contract, trie):
+        return encode_value({"codeHash": code_hash(contract), "storageHash": trie.root_hash()})
+
+    def set_contract(self, address, value):
+        """Set the account leaf of a contract to its value's JSON text, None removes it."""
+        if value is None:
+            self.contract_values.pop(address, None)
+            self.accounts.set(contract_key(address), None)
+        else:
+            self.contract_values[address] = value
+            self.accounts.set(contract_key(address), json.loads(value))
+
+    def seal(self, index, blockchain):
+        """Apply the changes since the last seal, record the root as the state of block `index` and return it (hex)."""
+        with self.lock:
+            for address in self.touched_balances:
+                self.accounts.set(balance_key(address), blockchain.balances.get(address))
+            before = {}
+            for address, keys in self.touched_contracts.items():
+                trie = self.storage.get(address)
+                if trie is not None:
+                    before[address] = trie.root
+                contract = None if keys is None else blockchain.contract_manager.get(address)
+                if contract is None:
+                    self.storage.pop(address, None)
+                    self.set_contract(address, None)
+                    continue
+                if trie is None:
+                    trie = self.storage[address] = build_trie(contract.state.items())
+                for key in keys:
+                    trie.set(key, contract.state.get(key))
+                self.set_contract(address, self.contract_value(contract, trie))
+            if self.sealed is not None:
+                self.storage_before[self.sealed] = before
+            self.touched_balances = set()
+            self.touched_contracts = {}
+            self.record(index)
+            return self.accounts.root_hash()
+
+    def record(self, index):
+        self.roots[index] = self.accounts.root
+        self.sealed = index
+        while len(self.roots) > STATE_ROOTS_KEPT:
+            self.roots.popitem(last=False)
+        while self.storage_before and next(iter(self.storage_before)) < next(iter(self.roots)):
+            self.storage_before.popitem(last=False)
+
+    def rebuild(self, blockchain, index):
+        """Build the account trie from scratch at block `index`, reusing contract leaves restored from a snapshot."""
+        with self.lock:
+            restored = self.contract_values
+            self.contract_values = {}
+            self.accounts = build_trie((balance_key(address), balance) for address, balance in blockchain.balances.items())
+            self.storage = OrderedDict()
+            for address in blockchain.contract_manager.addresses():
+                value = restored.get(address)
+                if value is None:
+                    contract = blockchain.contract_manager.get(address)
+                    value = self.contract_value(contract, build_trie(contract.state.items()))
+                self.set_contract(address, value)
+            self.touched_balances = set()
+            self.touched_contracts = {}
+            self.roots = OrderedDict()
+            self.storage_before = OrderedDict()
+            self.record(index)
+            return self.accounts.root_hash()
+
+    def restore(self, contract_values):
+        """Contract leaves saved by a snapshot, used by the next rebuild() instead of loading every contract."""
+        self.contract_values = dict(contract_values or {})
+
+    def state(self):
+        return dict(self.contract_values)
+
+    def root_at(self, index):
+        """(account trie root, root hash) of a recent block, None if it is too old or unknown."""
+        with self.lock:
+            if index not in self.roots:
+                return None
+            root = self.roots[index]
+        return root, StateTrie(root).root_hash()
+
+    def storage_root_at(self, contract, index):
+        """Root of a contract's storage trie as it was at a recent block."""
+        address = contract.address.lower()
+        with self.lock:
+            for block_index, before in self.storage_before.items():
+                if block_index >= index and address in before:
+                    return before[address]
+            return self.storage_trie(contract).root
+
+    def prove(self, blockchain, address, storage_keys, index):
+        """
+        Proofs for an address at a recent block: its balance, its contract leaf and the given
+        storage keys if it is a contract. None if the block's state is no longer kept.
+        """
+        address = address.lower()
+        found = self.root_at(index)
+        if found is None:
+            return None
+        root, root_hash = found
+        accounts = StateTrie(root)
+        balance_proof = accounts.prove(balance_key(address))
+        result = {
+            'address': address,
+            'blockNumber': hex(index),
+            'stateRoot': root_hash,
+            'balance': None if balance_proof['value'] is None else json.loads(balance_proof['value']),
+            'accountProof': balance_proof,
+            'contractProof': accounts.prove(contract_key(address)),
+            'codeHash': None,
+            'storageHash': None,
+            'storageProof': [],
+        }
+        contract_value = result['contractProof']['value']
+        contract = blockchain.contract_manager.get(address) if contract_value is not None else None
+        if contract is None:
+            return result
+        result.update(json.loads(contract_value))
+        storage = StateTrie(self.storage_root_at(contract, index))
+        result['storageProof'] = [storage.prove(str(key)) for key in storage_keys]
+        return result
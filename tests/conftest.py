@@ -0,0 +1,54 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from errors import InsufficientBalanceError
+from eventlog import EventLog
+from smartcontract import ContractManager, contract_from_records
+from utils import string_to_hex_with_prefix
+from worldstate import WorldState
+
+OWNER = "0x" + "11" * 20
+
+
+class FakeChain:
+    """The parts of Blockchain that contracts use, without a chain, storage or database."""
+
+    def __init__(self):
+        self.balances = {}
+        self.sent = []  # (sender, recipient, amount) of every transaction added
+        self.world_state = WorldState()
+        self.event_log = EventLog(None, None)
+        self.contract_manager = ContractManager(self)
+
+    def get_balance(self, address):
+        return int(self.balances.get(address.lower(), 0))
+
+    def add_transaction(self, sender, recipient, amount, nonce=None, replace=False):
+        if self.get_balance(sender) < int(amount):
+            raise InsufficientBalanceError(f"{sender} can't send {amount}")
+        self.sent.append((sender.lower(), recipient.lower(), int(amount)))
+
+    def get_last_block(self):
+        return SimpleNamespace(index=1)
+
+    def deploy(self, address, methods, state=None, owner=OWNER):
+        code = {"address": address, "owner": owner, "locked": False, "methods": methods}
+        contract = contract_from_records(self, code, dict(state or {}))
+        self.contract_manager.add(contract)
+        return contract
+
+
+def call_data(method, **args):
+    return string_to_hex_with_prefix(f"{method}|XYL|{json.dumps(args)}")
+
+
+@pytest.fixture
+def chain():
+    return FakeChain()
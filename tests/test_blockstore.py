@@ -0,0 +1,56 @@
+import os
+
+from block import Block
+from blockstore import BlockStore
+from transaction import Transaction
+
+
+def make_chain(height):
+    blocks = [Block(0, "0", [], 0)]
+    while len(blocks) < height:
+        last = blocks[-1]
+        tx = Transaction("0xa", "0xb", len(blocks), len(blocks), timestamp=1000.0 + len(blocks))
+        blocks.append(Block(last.index + 1, last.hash, [tx], len(blocks)))
+    return blocks
+
+
+def test_archived_blocks_read_back(tmp_path):
+    blocks = make_chain(10)
+    store = BlockStore(str(tmp_path), recent=3)
+    store.extend(blocks)
+    assert len(store) == 10 and store.tip[0] == 7
+    for i, block in enumerate(blocks):
+        assert store.hash_at(i) == block.hash
+        assert store[i].hash == block.hash
+        assert store[i].previous_hash == block.previous_hash
+        assert [tx.tx_hash for tx in store[i].transactions] == [tx.tx_hash for tx in block.transactions]
+    assert [b.index for b in store[-2:]] == [8, 9]
+
+
+def test_reopen_keeps_archived_blocks(tmp_path):
+    blocks = make_chain(10)
+    store = BlockStore(str(tmp_path), recent=3)
+    store.extend(blocks)
+    store.flush()
+    reopened = BlockStore(str(tmp_path), recent=3)
+    assert len(reopened) == 7
+    reopened.extend(blocks[7:])
+    assert [reopened.hash_at(i) for i in range(10)] == [block.hash for block in blocks]
+
+
+def test_reopen_drops_torn_records(tmp_path):
+    blocks = make_chain(12)
+    store = BlockStore(str(tmp_path), recent=2)
+    store.extend(blocks[:7])  # 5 archived
+    store.flush()
+    with open(tmp_path / 'hash.col', 'ab') as f:
+        f.write(b'\xff' * 10)  # a record cut short by a crash
+    with open(tmp_path / 'index.col', 'ab') as f:
+        f.write(b'\xff' * 8)  # a whole record the other columns never got
+    reopened = BlockStore(str(tmp_path), recent=2)
+    assert len(reopened) == 5
+    assert all(os.path.getsize(tmp_path / name) == 5 * column.struct.size
+               for name, column in (('hash.col', reopened.hashes), ('index.col', reopened.indices)))
+    reopened.extend(blocks[5:])
+    assert [reopened.hash_at(i) for i in range(12)] == [block.hash for block in blocks]
+    assert [reopened[i].index for i in range(12)] == list(range(12))
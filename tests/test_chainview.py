@@ -0,0 +1,20 @@
+from chainview import LayeredMap
+
+
+def test_updated_maps_keep_earlier_versions():
+    maps = [LayeredMap()]
+    expected = [{}]
+    for step in range(200):
+        changes = {f"0x{step % 37:x}": step, f"0x{step:x}": -step}
+        maps.append(maps[-1].updated(dict(changes)))
+        expected.append({**expected[-1], **changes})
+    for layered, plain in zip(maps, expected):
+        assert dict(layered) == plain
+        assert len(layered) == len(plain)
+    assert maps[-1].get("missing", 0) == 0
+    assert len(maps[-1].layers) <= 8
+
+
+def test_no_changes_reuses_the_map():
+    layered = LayeredMap().updated({"a": 1})
+    assert layered.updated({}) is layered
@@ -0,0 +1,82 @@
+import base64
+
+import pytest
+
+import smartcontract
+from conftest import OWNER, FakeChain, call_data
+from contractstore import ContractStore
+from smartcontract import ContractManager
+
+KEY = base64.urlsafe_b64encode(bytes(range(32)))
+METHODS = {'bump': ["GET total", "PUSH_ARG amount", "ADD", "SET total"]}
+
+
+def address(i):
+    return f"0x{i:040x}"
+
+
+@pytest.fixture
+def stored_chain(tmp_path, monkeypatch):
+    monkeypatch.setattr(smartcontract, 'MAX_LOADED_CONTRACTS', 2)
+    chain = FakeChain()
+    chain.contract_manager = ContractManager(chain, ContractStore(str(tmp_path), KEY))
+    for i in range(1, 5):
+        chain.deploy(address(i), METHODS, {'total': 0})
+    chain.contract_manager.save()
+    return chain, str(tmp_path)
+
+
+def test_contracts_load_lazily_and_persist(stored_chain):
+    chain, directory = stored_chain
+    manager = ContractManager(chain, ContractStore(directory, KEY))
+    assert not manager.contracts and len(manager.addresses()) == 4
+    chain.contract_manager = manager
+    assert 'error' not in manager.get(address(3)).execute(chain, call_data('bump', amount=5), OWNER)
+    manager.save()
+    assert ContractManager(chain, ContractStore(directory, KEY)).get(address(3)).state == {'total': 5}
+
+
+def test_contract_evicted_during_a_call(stored_chain):
+    chain, directory = stored_chain
+    manager = chain.contract_manager
+    running = manager.get(address(1))
+    manager.get(address(2))
+    manager.get(address(3))  # address(1) is the least recently used, it is unloaded
+    assert address(1) not in manager.contracts
+    assert 'error' not in running.execute(chain, call_data('bump', amount=7), OWNER)
+    assert manager.get(address(1)) is running
+    manager.save()
+    assert ContractManager(chain, ContractStore(directory, KEY)).get(address(1)).state == {'total': 7}
+
+
+def test_unloading_writes_back_only_the_evicted_contract(stored_chain, monkeypatch):
+    chain, _ = stored_chain
+    manager = chain.contract_manager
+    for i in (1, 2):
+        manager.get(address(i)).execute(chain, call_data('bump', amount=1), OWNER)
+    written = []
+    monkeypatch.setattr(manager.store, 'write_state', lambda c_address, state: written.append(c_address))
+    manager.get(address(3))
+    assert written == [address(1)]
+    assert manager.dirty_state == {address(2)}
+
+
+def test_replaced_contract_keeps_its_own_program(chain):
+    old = chain.deploy(address(1), METHODS, {'total': 10})
+    new = chain.deploy(address(1), {'bump': ["GET total", "PUSH_ARG amount", "SUB", "SET total"]}, {'total': 10})
+    manager = chain.contract_manager
+    del manager.compiled[address(1)]['bump']
+    assert 'error' not in old.execute(chain, call_data('bump', amount=1), OWNER)
+    assert old.state == {'total': 11}
+    assert 'error' not in new.execute(chain, call_data('bump', amount=1), OWNER)
+    assert new.state == {'total': 9}
+
+
+def test_compiled_programs_follow_loaded_contracts(stored_chain):
+    chain, directory = stored_chain
+    manager = chain.contract_manager
+    assert set(manager.compiled) == set(manager.contracts)
+    manager.get(address(1))
+    assert set(manager.compiled) == set(manager.contracts) == {address(4), address(1)}
+    manager.delete(address(1))
+    assert set(manager.compiled) == {address(4)}
@@ -0,0 +1,86 @@
+import base64
+import os
+import pickle
+
+import pytest
+from cryptography.fernet import Fernet, InvalidToken
+
+from block import Block
+from chainlog import ChainLog
+from crypt_util import MAGIC, append_encrypted_record, ep_load, ep_save, iter_encrypted_records, read_encrypted_record
+
+KEY = base64.urlsafe_b64encode(bytes(range(32)))
+
+
+@pytest.mark.parametrize("data", [list(range(50)), {f"k{i}": i for i in range(50)}, ("x" * 5000, 7)])
+def test_roundtrip(tmp_path, data):
+    path = str(tmp_path / "data")
+    ep_save(data, path, KEY)
+    assert ep_load(path, KEY) == data
+    with open(path, 'rb') as f:
+        assert f.read(len(MAGIC)) == MAGIC
+
+
+def test_single_records(tmp_path):
+    path = str(tmp_path / "data")
+    ep_save(list(range(50)), path, KEY)
+    assert ep_load(path, KEY, record=42) == 42
+    ep_save({"a": 1, "b": 2}, path, KEY)
+    assert ep_load(path, KEY, record="b") == 2
+
+
+def test_unindexed_dict_is_one_object(tmp_path):
+    path = str(tmp_path / "balances")
+    balances = {f"0x{i:040x}": i * 10**18 for i in range(1000)}
+    ep_save(balances, path, KEY, indexed=False)
+    assert ep_load(path, KEY) == balances
+    with open(path, 'rb') as f:
+        assert f.read(len(MAGIC) + 1) == MAGIC + b'O'
+    assert not os.path.exists(path + '.idx')
+
+
+def test_files_have_their_own_key(tmp_path):
+    ep_save([1], str(tmp_path / "one"), KEY)
+    ep_save([1], str(tmp_path / "two"), KEY)
+    with open(tmp_path / "one", 'rb') as one, open(tmp_path / "two", 'rb') as two:
+        assert one.read() != two.read()
+
+
+def test_legacy_single_blob(tmp_path):
+    path = str(tmp_path / "legacy")
+    with open(path, 'wb') as f:
+        f.write(Fernet(KEY).encrypt(pickle.dumps({"a": 1})))
+    assert ep_load(path, KEY) == {"a": 1}
+    assert ep_load(path, KEY, record="a") == 1
+
+
+def test_records_use_the_derived_key(tmp_path):
+    path = str(tmp_path / "active.log")
+    offset = append_encrypted_record("new", path, KEY)
+    with open(path, 'rb') as f:
+        f.seek(offset + 4)
+        with pytest.raises(InvalidToken):
+            Fernet(KEY).decrypt(f.read())
+    assert read_encrypted_record(path, KEY, offset) == "new"
+
+
+def test_records_under_the_master_key_still_read(tmp_path):
+    path = str(tmp_path / "active.log")
+    token = Fernet(KEY).encrypt(pickle.dumps("old"))
+    with open(path, 'wb') as f:
+        f.write(len(token).to_bytes(4, 'big') + token)
+    append_encrypted_record("new", path, KEY)
+    assert list(iter_encrypted_records(path, KEY)) == ["old", "new"]
+
+
+def test_chain_log_compaction(tmp_path):
+    directory = str(tmp_path / "chain")
+    log = ChainLog(directory, KEY, compact_every=3)
+    blocks = [Block(i, "0", [], i) for i in range(3)]
+    for block in blocks:
+        log.append(block)
+    assert not os.path.exists(log.active)
+    assert log.read_block(1).hash == blocks[1].hash
+    assert log.read_block(5) is None
+    log.append(Block(3, "0", [], 3))
+    assert [block.index for block in ChainLog(directory, KEY).replay()] == [0, 1, 2, 3]
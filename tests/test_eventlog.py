@@ -0,0 +1,53 @@
+import base64
+
+import eventlog
+from eventlog import EventLog
+
+KEY = base64.urlsafe_b64encode(bytes(range(32)))
+
+
+def event(i, address="0xc1", name="Bumped", block=1):
+    return {"address": address, "event": name, "data": {"i": i}, "blockNumber": block, "timestamp": 0.0}
+
+
+def emit(log, tx_hash, *events):
+    for e in events:
+        log.append(e)
+    log.assign(tx_hash)
+
+
+def test_assigned_events_survive_a_crash(tmp_path, monkeypatch):
+    monkeypatch.setattr(eventlog, 'PAGE_SIZE', 4)
+    log = EventLog(str(tmp_path), KEY)
+    for i in range(6):
+        emit(log, f"tx{i}", event(i))
+    log.append(event(6))  # never assigned, its call didn't finish
+    reopened = EventLog(str(tmp_path), KEY)  # no save(): as after a crash
+    assert [(e['data']['i'], e['transactionHash']) for e in reopened.query()] == [(i, f"tx{i}") for i in range(6)]
+    emit(reopened, "tx7", event(7))
+    assert [e['logIndex'] for e in reopened.query()] == list(range(7))
+
+
+def test_unassigned_events_are_hidden(tmp_path):
+    log = EventLog(str(tmp_path), KEY)
+    emit(log, "tx0", event(0))
+    filter_id = log.new_filter({})
+    log.append(event(1))
+    assert [e['transactionHash'] for e in log.query()] == ["tx0"]
+    assert log.filter_changes(filter_id) == []
+    log.assign("tx1")
+    assert [e['transactionHash'] for e in log.filter_changes(filter_id)] == ["tx1"]
+    assert log.filter_changes(filter_id) == []
+
+
+def test_query_reads_only_matching_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(eventlog, 'PAGE_SIZE', 3)
+    log = EventLog(str(tmp_path), KEY)
+    for i in range(9):
+        emit(log, f"tx{i}", event(i, address="0xc2" if i < 3 else "0xc1", block=i))
+    log.save()
+    reopened = EventLog(str(tmp_path), KEY)
+    assert [e['data']['i'] for e in reopened.query(addresses={"0xc2"})] == [0, 1, 2]
+    assert len(reopened.pages) == 1
+    assert [e['data']['i'] for e in reopened.query(from_block=4, to_block=6)] == [4, 5, 6]
+    assert [e['data']['i'] for e in reopened.query(after=6, limit=1)] == [7]
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+
+from errors import MempoolFullError
+from mempool import Mempool
+
+
+def tx(tx_hash, amount, sender="0xA", nonce=0):
+    return SimpleNamespace(tx_hash=tx_hash, amount=amount, sender=sender, nonce=nonce)
+
+
+def test_select_is_highest_fee_then_earliest():
+    pool = Mempool()
+    for t in (tx("a", 1), tx("b", 5, nonce=1), tx("c", 1, nonce=2), tx("d", 5, nonce=3)):
+        pool.add(t)
+    assert [t.tx_hash for t in pool.select(10)] == ["b", "d", "a", "c"]
+    assert [t.tx_hash for t in pool.select(2)] == ["b", "d"]
+    assert len(pool) == 4  # select doesn't remove
+
+
+def test_removed_transactions_are_not_selected():
+    pool = Mempool()
+    pool.add(tx("a", 5))
+    pool.add(tx("b", 1, nonce=1))
+    assert pool.remove("a").tx_hash == "a"
+    assert pool.remove("a") is None
+    assert [t.tx_hash for t in pool.select(10)] == ["b"]
+    assert pool.pending_count("0xa") == 1
+
+
+def test_full_pool_evicts_cheapest_or_refuses():
+    pool = Mempool(max_size=2)
+    pool.add(tx("a", 1))
+    pool.add(tx("b", 3, nonce=1))
+    pool.add(tx("c", 2, nonce=2))
+    assert "a" not in pool and len(pool) == 2
+    with pytest.raises(MempoolFullError):
+        pool.add(tx("d", 1, nonce=3))
+
+
+def test_replace_drops_same_sender_and_nonce():
+    pool = Mempool()
+    pool.add(tx("a", 1, nonce=7))
+    replaced = pool.replace(tx("b", 2, sender="0xa", nonce=7))
+    assert [t.tx_hash for t in replaced] == ["a"]
+    assert pool.find("0xA", 7).tx_hash == "b"
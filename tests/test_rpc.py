@@ -0,0 +1,63 @@
+import base64
+
+import pytest
+
+from blockchain import Blockchain
+from rpc import handle_rpc
+from storage import MemoryStorage
+
+KEY = base64.urlsafe_b64encode(bytes(range(32))).decode()
+SENDER = "0x" + "aa" * 20
+RECIPIENT = "0x" + "bb" * 20
+
+
+@pytest.fixture
+def blockchain(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("KEY", KEY)
+    monkeypatch.setenv("CONTRACT_KEY", KEY)
+    blockchain = Blockchain(storage=MemoryStorage())
+    blockchain.balances[SENDER] = 10 ** 21
+    yield blockchain
+    blockchain.scheduler.shutdown()
+
+
+def transfer(nonce, recipient=RECIPIENT, value=10 ** 18):
+    return {'chainId': 6934, 'gas': 10 ** 16, 'gasPrice': 1, 'value': value, 'from_': SENDER,
+            'nonce': nonce, 'to': recipient, 'data': ''}
+
+
+def transaction_count(blockchain, *tag):
+    response = handle_rpc(blockchain, {'jsonrpc': '2.0', 'id': 1, 'method': 'eth_getTransactionCount',
+                                       'params': [SENDER, *tag]})
+    return int(response['result'], 16)
+
+
+def send(blockchain, tx_dict):
+    response = blockchain.send_raw_transaction(f"0x{tx_dict['nonce']:02x}{tx_dict['to']}", tx_dict)
+    blockchain.publish_view()
+    return response
+
+
+def test_pending_count_gives_the_next_nonce(blockchain):
+    for nonce in range(3):
+        assert transaction_count(blockchain, 'pending') == nonce
+        assert 'error' not in send(blockchain, transfer(nonce))
+    assert transaction_count(blockchain, 'pending') == 3
+    assert transaction_count(blockchain, 'latest') == transaction_count(blockchain) == 0
+
+
+def test_nonces_must_be_the_next_one(blockchain):
+    assert 'error' not in send(blockchain, transfer(0))
+    assert send(blockchain, transfer(0)) == {'error': 'Invalid nonce provided.'}
+    assert send(blockchain, transfer(2)) == {'error': 'Invalid nonce provided.'}
+    assert 'error' not in send(blockchain, transfer(1))
+
+
+def test_any_pending_nonce_can_be_cancelled(blockchain):
+    for nonce in range(3):
+        send(blockchain, transfer(nonce))
+    assert 'error' not in send(blockchain, transfer(1, recipient=SENDER, value=0))
+    assert blockchain.find_pending(SENDER, 1).amount == 0
+    assert send(blockchain, transfer(3, recipient=SENDER, value=0)) == {'error': 'Transaction not found or already mined.'}
+    assert transaction_count(blockchain, 'pending') == 3
@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from conftest import OWNER, FakeChain, call_data
+from scheduler import ContractCall, ExecutionScheduler
+
+METHODS = {
+    'bump': ["GET total", "PUSH_ARG amount", "ADD", "SET total"],
+    'copy': ["GET total", "SET copy"],
+    'pay': ["PUSH_ARG to", "SET to", "PUSH_ARG amount", "SET amount", "SEND_TX to amount"],
+    'log': ["PUSH_ARG name", "SET name", "PUSH_ARG data", "SET data", "EMIT_EVENT name data"],
+    'fail': ["PUSH_ARG amount", "SET total", "PUSH 1", "PUSH 0", "DIV"],
+}
+
+
+def make_chain(contracts):
+    chain = FakeChain()
+    for i in range(contracts):
+        address = f"0x{i + 1:040x}"
+        chain.deploy(address, METHODS, {'total': 0})
+        chain.balances[address] = 50
+    return chain
+
+
+def make_calls(count, contracts, seed):
+    rng = random.Random(seed)
+    calls = []
+    for i in range(count):
+        address = f"0x{rng.randrange(contracts) + 1:040x}"
+        method = rng.choice(list(METHODS) + ['bump', 'bump', 'xyl_lock', 'missing'])
+        args = {'amount': rng.randrange(1, 20), 'to': "0xd", 'name': "Bumped", 'data': {'i': i}}
+        calls.append(ContractCall(address, call_data(method, **args), OWNER, None, f"tx{i}"))
+    return calls
+
+
+def outcome(chain, responses):
+    contracts = {address: (dict(contract.state), contract.locked)
+                 for address, contract in chain.contract_manager.contracts.items()}
+    events = [(event['address'], event['data'], event['transactionHash']) for event in chain.event_log.query()]
+    return responses, contracts, chain.sent, events
+
+
+@pytest.mark.parametrize("contracts,seed", [(1, 1), (3, 2), (20, 3)])
+def test_scheduled_batch_matches_serial_execution(contracts, seed):
+    serial_chain = make_chain(contracts)
+    serial = []
+    for call in make_calls(200, contracts, seed):
+        response = serial_chain.contract_manager.get(call.contract_address).execute(
+            serial_chain, call.data, call.sender, call.gas_limit)
+        if 'state' in response:
+            response = dict(response, state=dict(response['state']))  # the contract's own dict, changed by later calls
+        serial.append(response)
+        serial_chain.event_log.assign(call.tx_hash)
+
+    scheduled_chain = make_chain(contracts)
+    scheduler = ExecutionScheduler(scheduled_chain, workers=4)
+    try:
+        scheduled = scheduler.execute(make_calls(200, contracts, seed))
+    finally:
+        scheduler.shutdown()
+    assert outcome(scheduled_chain, scheduled) == outcome(serial_chain, serial)
+    if contracts == 1:
+        assert scheduler.reexecuted > 0
+
+
+def test_unrelated_contracts_do_not_conflict():
+    chain = make_chain(10)
+    calls = [ContractCall(f"0x{i + 1:040x}", call_data('bump', amount=1), OWNER, None, str(i)) for i in range(10)]
+    scheduler = ExecutionScheduler(chain, workers=4)
+    try:
+        scheduler.execute(calls)
+    finally:
+        scheduler.shutdown()
+    assert scheduler.reexecuted == 0
+    assert all(contract.state['total'] == 1 for contract in chain.contract_manager.contracts.values())
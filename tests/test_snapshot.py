@@ -0,0 +1,41 @@
+import base64
+
+from crypt_util import ep_save
+from snapshot import SNAPSHOT_VERSION, load_snapshot, save_snapshot
+
+KEY = base64.urlsafe_b64encode(bytes(range(32)))
+
+SNAPSHOT = {
+    'version': SNAPSHOT_VERSION,
+    'height': 3,
+    'tip_hash': 'ab' * 64,
+    'balances': {'0x1': 5},
+    'tx_counts': {'0x1': 1},
+    'tx_index': {'ff': 2},
+    'retarget': {'algorithm': 'lwma', 'target': 2 ** 200, 'history': []},
+    'contract_leaves': {},
+}
+
+
+def test_roundtrip(tmp_path):
+    path = str(tmp_path / "snapshot")
+    save_snapshot(SNAPSHOT, path, KEY)
+    assert load_snapshot(path, KEY) == SNAPSHOT
+
+
+def test_missing_file(tmp_path):
+    assert load_snapshot(str(tmp_path / "snapshot"), KEY) is None
+
+
+def test_other_versions_are_ignored(tmp_path):
+    path = str(tmp_path / "snapshot")
+    ep_save(dict(SNAPSHOT, version=SNAPSHOT_VERSION - 1), path, KEY)
+    assert load_snapshot(path, KEY) is None
+
+
+def test_snapshots_missing_a_field_are_ignored(tmp_path, capsys):
+    path = str(tmp_path / "snapshot")
+    for field in ('retarget', 'contract_leaves'):
+        ep_save({name: value for name, value in SNAPSHOT.items() if name != field}, path, KEY)
+        assert load_snapshot(path, KEY) is None
+        assert field in capsys.readouterr().out
@@ -0,0 +1,70 @@
+import random
+
+from statetrie import EMPTY, StateTrie, build_trie, verify_proof
+
+ITEMS = [(f"key{i}", {'value': i}) for i in range(200)]
+
+
+def test_empty_root():
+    assert StateTrie().root_hash() == EMPTY.hex()
+    assert build_trie([]).root_hash() == EMPTY.hex()
+
+
+def test_root_is_independent_of_write_order():
+    shuffled = list(ITEMS)
+    random.Random(1).shuffle(shuffled)
+    forward, backward = StateTrie(), StateTrie()
+    for key, value in ITEMS:
+        forward.set(key, value)
+    for key, value in shuffled:
+        backward.set(key, value)
+    assert forward.root_hash() == backward.root_hash() == build_trie(ITEMS).root_hash()
+
+
+def test_incremental_updates_match_rebuild():
+    trie = build_trie(ITEMS)
+    items = dict(ITEMS)
+    for i in range(0, 200, 3):
+        trie.set(f"key{i}", None)
+        del items[f"key{i}"]
+    for i in range(1, 200, 7):
+        trie.set(f"key{i}", "changed")
+        items[f"key{i}"] = "changed"
+    assert trie.root_hash() == build_trie(items.items()).root_hash()
+    for key in list(items):
+        trie.set(key, None)
+    assert trie.root_hash() == EMPTY.hex()
+
+
+def test_old_roots_stay_readable():
+    trie = build_trie(ITEMS)
+    old_root, old_hash = trie.root, trie.root_hash()
+    trie.set("key1", "new")
+    assert trie.get("key1") == '"new"'
+    assert trie.get("key1", old_root) == '{"value": 1}'
+    assert verify_proof(old_hash, trie.prove("key1", old_root))
+
+
+def test_proofs_of_presence_and_absence():
+    trie = build_trie(ITEMS)
+    root_hash = trie.root_hash()
+    for key in ("key0", "key99", "key199"):
+        proof = trie.prove(key)
+        assert proof['value'] is not None
+        assert verify_proof(root_hash, proof)
+    for key in ("missing", "key200", "key-1"):
+        proof = trie.prove(key)
+        assert proof['value'] is None
+        assert verify_proof(root_hash, proof)
+
+
+def test_tampered_proofs_fail():
+    trie = build_trie(ITEMS)
+    root_hash = trie.root_hash()
+    proof = trie.prove("key5")
+    assert not verify_proof(root_hash, dict(proof, value='{"value": 6}'))
+    assert not verify_proof(root_hash, dict(proof, value=None))
+    assert not verify_proof(root_hash, dict(trie.prove("missing"), key="key5"))
+    siblings = list(proof['siblings'])
+    siblings[0] = EMPTY.hex()
+    assert not verify_proof(root_hash, dict(proof, siblings=siblings))
@@ -0,0 +1,75 @@
+import pytest
+
+from blockchain import Blockchain
+from storage import MemoryStorage
+from worldstate import WorldState
+
+
+def test_commit_block_writes_block_and_balances():
+    storage = MemoryStorage()
+    storage.commit_block({"index": 1, "hash": "b"}, {"0xa": 5, "0xb": 7})
+    storage.commit_block({"index": 0, "hash": "a"}, {"0xa": 3})
+    assert [doc["index"] for doc in storage.find_blocks()] == [0, 1]
+    assert [doc["index"] for doc in storage.find_blocks(after=0)] == [1]
+    assert storage.find_balances() == [{"address": "0xa", "balance": "3"}, {"address": "0xb", "balance": "7"}]
+    assert storage.writes == 4
+
+
+def test_found_blocks_are_copies():
+    storage = MemoryStorage()
+    storage.insert_block({"index": 0, "transactions": []})
+    storage.find_blocks()[0]["transactions"].append("tx")
+    assert storage.find_blocks()[0]["transactions"] == []
+
+
+def test_empty_balance_batch_is_not_a_write():
+    storage = MemoryStorage()
+    storage.write_balances({})
+    assert storage.writes == 0
+
+
+class FlakyStorage(MemoryStorage):
+    """Fails its first `failures` block commits, like a dropped database connection."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def commit_block(self, block_doc, balances):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unavailable")
+        super().commit_block(block_doc, balances)
+
+
+def offline_blockchain(storage):
+    blockchain = Blockchain.__new__(Blockchain)
+    blockchain.storage = storage
+    blockchain.balances = {}
+    blockchain.dirty_balances = set()
+    blockchain.unpublished = (set(), set())
+    blockchain.world_state = WorldState()
+    return blockchain
+
+
+def test_failed_commit_keeps_balances_pending():
+    storage = FlakyStorage(failures=1)
+    blockchain = offline_blockchain(storage)
+    blockchain.update_balance("0xA", 5)
+    with pytest.raises(ConnectionError):
+        blockchain.commit_block({"index": 1, "hash": "b"})
+    assert storage.find_balances() == []
+    blockchain.update_balance("0xb", 7)
+    blockchain.commit_block({"index": 2, "hash": "c"})
+    assert storage.find_balances() == [{"address": "0xa", "balance": "5"}, {"address": "0xb", "balance": "7"}]
+    assert blockchain.dirty_balances == set()
+
+
+def test_flush_writes_pending_balances_once():
+    storage = MemoryStorage()
+    blockchain = offline_blockchain(storage)
+    blockchain.update_balance("0xa", 5)
+    blockchain.flush_balances()
+    blockchain.flush_balances()
+    assert storage.find_balances() == [{"address": "0xa", "balance": "5"}]
+    assert storage.writes == 1
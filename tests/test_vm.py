@@ -0,0 +1,97 @@
+import pytest
+
+from conftest import OWNER, call_data
+from errors import ExecutionError, GasLimitExceededError
+from vm import CALL_GAS, MAX_VALUE_WORDS, ExecutionContext, compile_method, run
+
+
+class Store:
+    def __init__(self):
+        self.state = {}
+
+    def set(self, key, value):
+        self.state[key] = value
+        return 1
+
+    def get(self, key):
+        return self.state.get(key)
+
+
+def run_method(instructions, args=None, gas_limit=None):
+    ctx = ExecutionContext(Store(), args or {}, gas_limit=gas_limit)
+    return run(compile_method(instructions), ctx)
+
+
+def test_static_gas():
+    ctx = run_method(["PUSH_ARG a", "PUSH_ARG b", "ADD", "SET total"], {'a': 2, 'b': 3})
+    assert ctx.contract.state == {'total': 5}
+    assert ctx.gas_used == CALL_GAS + 3 + 3 + 3 + 20
+
+
+def test_out_of_gas_stops_before_the_instruction_it_cant_pay():
+    with pytest.raises(GasLimitExceededError):
+        run_method(["PUSH_ARG a", "SET x", "PUSH_ARG a", "SET y"], {'a': 1}, gas_limit=CALL_GAS + 30)
+
+
+def test_doubling_a_string_runs_out_of_gas():
+    instructions = ["PUSH_ARG s", "SET s"] + ["GET s", "GET s", "ADD", "SET s"] * 40
+    with pytest.raises((GasLimitExceededError, ExecutionError)):
+        run_method(instructions, {'s': "x" * 1000}, gas_limit=20000)
+
+
+def test_values_are_capped():
+    instructions = ["PUSH_ARG n", "SET n"] + ["GET n", "GET n", "MUL", "SET n"] * 30
+    with pytest.raises(ExecutionError, match="limit"):
+        run_method(instructions, {'n': 3})
+    with pytest.raises(ExecutionError):
+        run_method(["PUSH_ARG s", "PUSH_ARG n", "MUL"], {'s': "x", 'n': 10 ** 9})
+    assert run_method(["PUSH_ARG s", "PUSH_ARG s", "ADD", "SET s"], {'s': "x" * 32 * (MAX_VALUE_WORDS // 2)}).contract.state['s']
+
+
+def test_size_gas_is_charged():
+    small = run_method(["PUSH_ARG a", "PUSH_ARG a", "ADD"], {'a': "x"})
+    large = run_method(["PUSH_ARG a", "PUSH_ARG a", "ADD"], {'a': "x" * 3200})
+    assert large.gas_used - small.gas_used == (200 - 1) - (2 - 1)  # 100 words each, against 1
+
+
+@pytest.mark.parametrize("op", ["ADD", "SUB", "MUL", "LT", "GT"])
+def test_integer_size_gas_starts_past_one_word(op):
+    one_word = run_method(["PUSH_ARG a", "PUSH_ARG a", op], {'a': (1 << 256) - 1})
+    two_words = run_method(["PUSH_ARG a", "PUSH_ARG a", op], {'a': 1 << 256})
+    assert one_word.gas_used == CALL_GAS + compile_method(["PUSH_ARG a", "PUSH_ARG a", op]).gas
+    assert two_words.gas_used > one_word.gas_used
+
+
+@pytest.mark.parametrize("op", ["ADD", "SUB", "MUL"])
+def test_arithmetic_rejects_mixed_operands(op):
+    with pytest.raises(ExecutionError):
+        run_method(["PUSH_ARG a", "PUSH_ARG b", op], {'a': 1, 'b': "x"})
+
+
+def test_failed_call_changes_nothing(chain):
+    contract = chain.deploy("0xc1", {'pay': ["PUSH_ARG to", "SET to", "PUSH_ARG amount", "SET amount",
+                                             "SEND_TX to amount", "PUSH_ARG x", "SET x", "PUSH 1", "PUSH 0", "DIV"]})
+    chain.balances["0xc1"] = 100
+    response = contract.execute(chain, call_data("pay", to="0xd", amount=10, x=1), OWNER)
+    assert response['error'].startswith("ExecutionError")
+    assert contract.state == {} and chain.sent == []
+
+
+def test_out_of_gas_call_changes_nothing(chain):
+    contract = chain.deploy("0xc1", {'bump': ["PUSH_ARG a", "SET a", "PUSH_ARG a", "SET b"]})
+    response = contract.execute(chain, call_data("bump", a=1), OWNER, gas_limit=CALL_GAS + 30)
+    assert response['error'].startswith("GasLimitExceededError") and response['gasUsed'] == CALL_GAS + 30
+    assert contract.state == {}
+    response = contract.execute(chain, call_data("bump", a=1), OWNER)
+    assert response['state'] == {'a': 1, 'b': 1} and contract.state == {'a': 1, 'b': 1}
+
+
+def test_sends_are_checked_together(chain):
+    contract = chain.deploy("0xc1", {'pay': ["PUSH_ARG to", "SET to", "PUSH_ARG amount", "SET amount",
+                                             "SEND_TX to amount", "SEND_TX to amount"]})
+    chain.balances["0xc1"] = 15
+    response = contract.execute(chain, call_data("pay", to="0xd", amount=10), OWNER)
+    assert 'error' in response and chain.sent == [] and contract.state == {}
+    chain.balances["0xc1"] = 20
+    assert 'error' not in contract.execute(chain, call_data("pay", to="0xd", amount=10), OWNER)
+    assert chain.sent == [("0xc1", "0xd", 10)] * 2